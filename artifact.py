@@ -0,0 +1,254 @@
+#!/usr/bin/python
+
+"""
+Artifacts:  Ships obfuscated or minified source as precompiled bytecode.
+
+A device that is given .py files has to compile them the first time they
+run (and every time, for the script that is run directly).  This writes the
+output of pyfuscate, pyminifier or the pipeline as a .pyc file, or as a
+runnable zipapp of .pyc files, instead.
+
+The .pyc files are deterministic, so building twice gives the same bytes:
+they use hash-based invalidation (PEP 552, unchecked, since no source is
+shipped) on Python 3.7 and later, and a zero timestamp before that.  With
+--optimize they are compiled as with -OO, without docstrings and asserts.
+
+With --artifact packed the output is instead a small .py program holding
+the code object, marshalled and compressed with zlib, bz2 or (where the
+lzma module is available) lzma, at the level given by --compress-level,
+which it decompresses and runs.  It is far smaller than the plain source, so on slow flash it is
+quicker to read, and there is nothing to compile.  It only runs on the
+version of Python that built it, and says so on any other.
+
+The tools take --artifact pyc, zipapp or packed for their output file.
+On its own, this compiles files or whole trees (such as the output of
+'pyfuscate.py -d'):
+
+    artifact.py -o build/ myproj_pyfuscated/
+    artifact.py --zipapp --main main_runtime -o runtime.pyz myproj_pyfuscated/
+"""
+
+import sys, os, imp, marshal, struct, zipfile, subprocess, optparse, stat, zlib, bz2, base64
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+kinds = ['py', 'pyc', 'zipapp', 'packed']
+compressions = ['zlib', 'bz2', 'lzma']
+zip_date = (1980, 1, 1, 0, 0, 0) # The earliest a zip file can record, for the same bytes on every build
+
+# The whole of a packed program but for its payload
+packed_stub = """import sys, marshal, base64, %(compression)s
+if sys.version_info[:2] != %(version)r:
+    sys.exit('This program needs Python %(version_text)s')
+exec(marshal.loads(%(compression)s.decompress(base64.b64decode(%(payload)r))))
+"""
+
+def compile_source(source, filename, optimize=False):
+    """Returns the code object for 'source'.  With 'optimize' it is compiled as
+with -OO, which Python 2 can only do in a child interpreter started with -OO."""
+    if not optimize or sys.flags.optimize >= 2:
+        return compile(source, filename, 'exec', 0, True)
+    if sys.version_info >= (3, 2):
+        return compile(source, filename, 'exec', 0, True, 2)
+    child = subprocess.Popen([sys.executable, '-OO', os.path.abspath(__file__), '--compile', filename],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    output = child.communicate(source)[0]
+    if child.returncode:
+        raise SyntaxError("%s could not be compiled" % filename)
+    return marshal.loads(output)
+
+def pyc_data(source, code):
+    """Returns the contents of a deterministic .pyc file for 'code', compiled from 'source'."""
+    try:
+        from importlib.util import source_hash, MAGIC_NUMBER
+    except ImportError:
+        header = imp.get_magic() + struct.pack('<I', 0)
+        if sys.version_info >= (3, 3):
+            header += struct.pack('<I', len(source) & 0xFFFFFFFF)
+        return header + marshal.dumps(code)
+    return MAGIC_NUMBER + struct.pack('<I', 1) + source_hash(source) + marshal.dumps(code)
+
+def write_pyc(path, source, optimize=False):
+    """Compiles 'source' into the .pyc file at 'path'."""
+    filename = os.path.splitext(os.path.basename(path))[0] + '.py'
+    data = pyc_data(source, compile_source(source, filename, optimize))
+    fileh = open(path, 'wb')
+    try:
+        fileh.write(data)
+    finally:
+        fileh.close()
+
+def write_zipapp(path, modules, optimize=False, interpreter='/usr/bin/env python'):
+    """Writes a runnable zip file to 'path' holding the compiled 'modules', a list
+of (name, source) pairs where each name is a path in the archive ending in .py.
+One of them should be __main__.py, which is what runs."""
+    fileh = open(path, 'wb')
+    try:
+        fileh.write('#!%s\n' % interpreter)
+        archive = zipfile.ZipFile(fileh, 'w', zipfile.ZIP_DEFLATED)
+        for name, source in sorted(modules):
+            info = zipfile.ZipInfo(name[:-len('.py')] + '.pyc', zip_date)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0644 << 16
+            archive.writestr(info, pyc_data(source, compile_source(source, os.path.basename(name), optimize)))
+        archive.close()
+    finally:
+        fileh.close()
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+def pack_source(source, filename, optimize=False, compression='zlib', level=9):
+    """Returns the source of a program that runs the code compiled from 'source', which it holds marshalled,
+    compressed with 'compression' (zlib, bz2 or lzma) at 'level' (0 to 9, 1 to 9 for bz2) and base64 encoded."""
+    data = marshal.dumps(compile_source(source, filename, optimize))
+    if compression == 'lzma':
+        data = lzma.compress(data, preset=level)
+    elif compression == 'bz2':
+        data = bz2.compress(data, level)
+    else:
+        data = zlib.compress(data, level)
+    payload = base64.b64encode(data)
+    if not isinstance(payload, str):
+        payload = payload.decode('ascii')
+    version = tuple(sys.version_info[:2])
+    return packed_stub % {'compression': compression, 'version': version, 'version_text': '%d.%d' % version,
+                          'payload': payload}
+
+def write_artifact(kind, path, source, optimize=False, compression='zlib', level=9):
+    """Writes the program 'source' to 'path' as plain source, a .pyc file, a zipapp or a packed program (see
+    pack_source()), as 'kind' says."""
+    if kind == 'pyc':
+        write_pyc(path, source, optimize)
+    elif kind == 'zipapp':
+        write_zipapp(path, [('__main__.py', source)], optimize)
+    else:
+        if kind == 'packed':
+            source = pack_source(source, os.path.basename(path), optimize, compression, level)
+        fileh = open(path, 'w')
+        try:
+            fileh.write(source)
+        finally:
+            fileh.close()
+
+def report_sizes(path, original_size, output_size, label='minified'):
+    """Writes the size of the original source, of the 'label' output made from it and of the packed program written
+    to 'path' to stderr."""
+    packed_size = os.path.getsize(path)
+    sys.stderr.write("%s: original %d bytes, %s %d bytes (%d%%), packed %d bytes (%d%%)\n" % (path, original_size,
+        label, output_size, 100 * output_size // max(original_size, 1), packed_size, 100 * packed_size // max(original_size, 1)))
+
+def add_options(parser):
+    """Adds the --artifact, --optimize, --compression and --compress-level options to the optparse 'parser'."""
+    parser.add_option('--artifact',
+                      action='store',
+                      type='choice',
+                      choices=kinds,
+                      dest='artifact',
+                      help='Write the output file as plain source (py), precompiled (pyc), a runnable zip of precompiled code (zipapp) or a program that unpacks its compressed code (packed) [default=%default]',
+                      default='py')
+    parser.add_option('--optimize',
+                      action='store_true',
+                      dest='optimize',
+                      help='Compile the pyc, zipapp or packed output as with -OO, without docstrings and asserts',
+                      default=False)
+    parser.add_option('--compression',
+                      action='store',
+                      type='choice',
+                      choices=compressions,
+                      dest='compression',
+                      help='Compress the packed output with zlib, bz2 or lzma (where the lzma module is available) [default=%default]',
+                      default='zlib')
+    parser.add_option('--compress-level',
+                      action='store',
+                      type='int',
+                      dest='compress_level',
+                      metavar='LEVEL',
+                      help='Compress the packed output at LEVEL, from 0 (fastest) to 9 (smallest) [default=%default]',
+                      default=9)
+
+def check_options(parser, options):
+    """Reports an error through the optparse 'parser' if the options added by add_options() cannot be used."""
+    if options.compression == 'lzma' and lzma is None:
+        parser.error("--compression lzma needs the lzma module (Python 3.3 or later)")
+    lowest = 0
+    if options.compression == 'bz2':
+        lowest = 1 # bz2 has no uncompressed level
+    if not lowest <= options.compress_level <= 9:
+        parser.error("--compress-level must be from %d to 9 for %s" % (lowest, options.compression))
+
+def find_sources(paths):
+    """Returns (name, path) for every .py file in 'paths' (files, or directories
+searched all the way down), named by their path under the directory given."""
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append((os.path.basename(path), path))
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith('.py'):
+                    full_path = os.path.join(dirpath, filename)
+                    found.append((os.path.relpath(full_path, path).replace(os.sep, '/'), full_path))
+    return found
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [OPTION]... -o OUTPUT SOURCE...')
+    parser.add_option('-o',
+                      '--output',
+                      action='store',
+                      type='string',
+                      dest='output',
+                      metavar='OUTPUT',
+                      help='The .pyc file or directory to compile into, or the zipapp to write with --zipapp')
+    parser.add_option('--zipapp',
+                      action='store_true',
+                      dest='zipapp',
+                      help='Write a runnable zip of the compiled files instead',
+                      default=False)
+    parser.add_option('-m',
+                      '--main',
+                      action='store',
+                      type='string',
+                      dest='main',
+                      metavar='MODULE',
+                      help='The module the zipapp runs [default=the only file given]',
+                      default='')
+    parser.add_option('--optimize',
+                      action='store_true',
+                      dest='optimize',
+                      help='Compile as with -OO, without docstrings and asserts',
+                      default=False)
+    parser.add_option('--compile', action='store', type='string', dest='compile_name', help=optparse.SUPPRESS_HELP)
+    (options, args) = parser.parse_args()
+    if options.compile_name:
+        # Run with -OO by compile_source() on behalf of a Python 2 parent
+        marshal.dump(compile(sys.stdin.read(), options.compile_name, 'exec', 0, True), sys.stdout)
+        return
+    if not options.output or not args:
+        parser.error("an output and at least one source must be given")
+    sources = find_sources(args)
+    if options.zipapp:
+        main_name = options.main and options.main.replace('.', '/') + '.py'
+        if not main_name and len(sources) == 1:
+            main_name = sources[0][0]
+        modules = []
+        for name, path in sources:
+            if name == main_name:
+                name = '__main__.py'
+            modules.append((name, open(path, 'r').read()))
+        if '__main__.py' not in [name for name, source in modules]:
+            parser.error("the module to run must be given with --main")
+        write_zipapp(options.output, modules, options.optimize)
+    elif len(sources) == 1 and options.output.endswith('.pyc'):
+        write_pyc(options.output, open(sources[0][1], 'r').read(), options.optimize)
+    else:
+        for name, path in sources:
+            target = os.path.join(options.output, name[:-len('.py')] + '.pyc')
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            write_pyc(target, open(path, 'r').read(), options.optimize)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,770 @@
+#!/usr/bin/python
+
+"""
+Benchmarks:  Times pyfuscate, pyminifier and compyne on synthetic corpora.
+
+Besides each tool on its own, 'chain' times compyne, pyfuscate and pyminifier
+run in turn on each other's output, 'pipeline' the same three stages fused
+into one pass by pipeline.py, and 'tree' pyfuscate's -d mode over the corpus
+directory, which holds the names of all its files at once.  'scope' is
+pyfuscate with --engine scope, including the setup that the default engine
+does before its timer starts (the walk over the builtins).  'parallel' is
+pyminifier with one worker process per core (at least two), which fails if
+its output, with the source split at every top-level statement, is not byte
+for byte the same as the serial minifier's, through minify() or through the
+streaming minify_file() that the command line uses.
+
+Each corpus is generated into a temporary directory (or the one given with
+--keep) at a size set by --scale:
+    small_modules   many small modules that import each other
+    huge_module     one very large module
+    deep_nesting    deeply nested blocks
+    long_literals   long bracketed literals spread over many lines
+    long_lines      machine-generated records, each on one very long line
+    import_heavy    files that import and use many standard modules
+
+Every tool runs on every corpus in a fresh child process, so the peak RSS
+reported is that of the tool alone.  The results can be saved as a JSON
+baseline with --save and a later run compared against it with --compare,
+which flags any time or memory regression above --tolerance.
+
+With --cold-start the pipeline output of each corpus is also written as
+plain source, a .pyc file, a zipapp and a packed program (compressed with
+zlib and with bz2), and the size of each and the time to start and run it in
+a fresh interpreter are reported.  With --lazy-start a program that
+only imports the first module of each corpus is bundled with all of it, both
+merged as usual and as a lazy bundle, and the time and peak RSS to run each
+bundle are reported.
+
+With --runtime the pipeline output of each corpus is also run as it is and
+with --optimize-runtime, checking that both print the same, and so is a set
+of small loop-heavy programs (runtime_programs), timing each version.
+
+With --stream-memory the huge_module corpus is generated at 8 and at 32 times
+--scale, and the peak RSS of running each of stream_commands on it from the
+command line is reported at both sizes.  The input is streamed, so only
+pyfuscate (whose rename map holds every name) should need more at the larger.
+
+With --name-cache the modules in cache_modules are introspected into an empty
+name cache and then looked up again from it, and the time of each pass is
+reported.  It fails if any module, submodules included, misses the cache the
+second time.
+"""
+
+import os, sys, time, json, optparse, tempfile, shutil, subprocess, tokenize, inspect, multiprocessing
+
+corpora = ['small_modules', 'huge_module', 'deep_nesting', 'long_literals', 'long_lines', 'import_heavy']
+tools = ['pyfuscate', 'scope', 'pyminifier', 'parallel', 'compyne', 'chain', 'pipeline', 'tree']
+parallel_jobs = max(multiprocessing.cpu_count(), 2)
+standard_modules = ['os', 'sys', 're', 'math', 'string', 'time', 'random', 'struct', 'collections',
+                    'itertools', 'functools', 'operator', 'json', 'base64', 'binascii', 'copy', 'heapq',
+                    'bisect', 'textwrap', 'fnmatch', 'glob', 'shutil', 'tempfile', 'hashlib', 'zlib',
+                    'datetime', 'calendar', 'decimal', 'fractions', 'difflib', 'pickle', 'csv', 'codecs',
+                    'weakref', 'array', 'locale']
+# Submodules that the name cache has to key differently: os.path is set up by os as it runs, and xml.dom.minidom is
+# in a package
+cache_modules = standard_modules + ['os.path', 'xml.dom.minidom']
+
+def small_modules(scale):
+    """Returns [(filename, source)] for 50*scale small modules, each importing a function from the one before it"""
+    files = []
+    for i in range(50 * scale):
+        lines = ['#!/usr/bin/python', '# Module number %d' % i, '"""Small module %d of the corpus."""' % i, 'import os, sys']
+        if i:
+            lines.append('from module_%d import helper_%d, Record_%d' % (i - 1, i - 1, i - 1))
+        lines += ['',
+                  'class Record_%d(object):' % i,
+                  '    """A record with a couple of fields."""',
+                  '    def __init__(self, name, value=0):',
+                  '        self.name = name # The record name',
+                  '        self.value = value',
+                  '',
+                  '    def describe(self):',
+                  '        return "%s=%d" % (self.name, self.value)',
+                  '',
+                  'def helper_%d(items, offset=1):' % i,
+                  '    """Sums up the items after shifting them by offset."""',
+                  '    total = 0',
+                  '    for item in items:',
+                  '        if item > offset:',
+                  '            total += item - offset',
+                  '        else:',
+                  '            total += offset',
+                  '    return total',
+                  '']
+        if i:
+            lines += ['def combined_%d(path):' % i,
+                      '    record = Record_%d(os.path.basename(path), helper_%d([1, 2, 3]))' % (i - 1, i - 1),
+                      '    sys.stdout.write(record.describe())',
+                      '    return record',
+                      '']
+        files.append(('module_%d.py' % i, '\n'.join(lines)))
+    return files
+
+def huge_module(scale):
+    """Returns [(filename, source)] for a single module with 500*scale functions and classes"""
+    lines = ['#!/usr/bin/python', '# -*- coding: utf-8 -*-', '"""One very large module."""', 'import os, re', '']
+    for i in range(500 * scale):
+        lines += ['def function_%d(first, second=None, *args, **kwargs):' % i,
+                  '    """Function number %d."""' % i,
+                  '    result = [first]',
+                  '    if second is not None:',
+                  '        result.append(second) # Keep the second one',
+                  '    for index, arg in enumerate(args):',
+                  '        result.append(arg * index)',
+                  '    return os.path.join(*[str(x) for x in result])',
+                  '',
+                  'class Holder_%d:' % i,
+                  "    pattern = re.compile(r'value_%d\\s*=')" % i,
+                  '    def __init__(self):',
+                  '        self.items = {"key": function_%d(1, 2, 3)}' % i,
+                  '',
+                  '    def lookup(self, key):',
+                  '        return self.items.get(key, self.pattern.pattern)',
+                  '']
+    return [('huge_module.py', '\n'.join(lines))]
+
+def deep_nesting(scale):
+    """Returns [(filename, source)] for a module of 20*scale functions, each nested 20 blocks deep"""
+    lines = ['"""Deeply nested blocks."""', '']
+    for i in range(20 * scale):
+        lines.append('def nested_%d(values):' % i)
+        indent = '    '
+        lines.append(indent + 'total = 0')
+        for depth in range(20):
+            kind = depth % 4
+            if kind == 0:
+                lines.append(indent + 'for value_%d in values:' % depth)
+            elif kind == 1:
+                lines.append(indent + 'if value_%d > %d:' % (depth - 1, depth))
+            elif kind == 2:
+                lines.append(indent + 'while total < %d:' % (depth * 10))
+            else:
+                lines.append(indent + 'try:')
+            indent += '    '
+            lines.append(indent + 'total += %d # Depth %d' % (depth, depth))
+        for depth in reversed(range(20)):
+            indent = indent[:-4]
+            if depth % 4 == 2:
+                lines.append(indent + '    break')
+            elif depth % 4 == 3:
+                lines.append(indent + 'except ValueError:')
+                lines.append(indent + '    pass')
+        lines.append('    return total')
+        lines.append('')
+    return [('deep_nesting.py', '\n'.join(lines))]
+
+def long_literals(scale):
+    """Returns [(filename, source)] for a module of 20*scale literals, each 200 entries long and one entry per line"""
+    lines = ['"""Long bracketed literals."""', '']
+    for i in range(20 * scale):
+        kind = i % 3
+        if kind == 0:
+            lines.append('table_%d = {' % i)
+            lines += ["    'key_%d': (%d, 'value_%d'), # Entry %d" % (j, j, j, j) for j in range(200)]
+            lines.append('}')
+        elif kind == 1:
+            lines.append('items_%d = [' % i)
+            lines += ['    [%d, %d.5, "item_%d"],' % (j, j, j) for j in range(200)]
+            lines.append(']')
+        else:
+            lines.append('result_%d = max(' % i)
+            lines += ['    %d * (%d + 1),' % (j, j) for j in range(200)]
+            lines.append(')')
+        lines.append("""label_%d = ('' 'part_%d' "" "part_%d" '')""" % (i, i, i)) # Strings joined implicitly
+        lines.append('')
+    return [('long_literals.py', '\n'.join(lines))]
+
+def long_lines(scale):
+    """Returns [(filename, source)] for a module of 50*scale records, each a call with 250 keyword arguments on one
+    line, drawn from 20 sets of field names"""
+    lines = ['"""Machine-generated records."""', '']
+    for i in range(50 * scale):
+        fields = ', '.join(['field_%d_%d=%d' % (i % 20, j, j) for j in range(250)])
+        lines.append('record_%d = dict(%s)' % (i, fields))
+    return [('long_lines.py', '\n'.join(lines) + '\n')]
+
+def import_heavy(scale):
+    """Returns [(filename, source)] for 10*scale modules that each import and use many standard modules"""
+    files = []
+    for i in range(10 * scale):
+        lines = ['"""Imports a lot of standard modules."""']
+        lines += ['import %s' % name for name in standard_modules]
+        lines.append('')
+        lines.append('def use_modules_%d():' % i)
+        lines.append('    found = []')
+        for name in standard_modules:
+            lines.append("    found.append(getattr(%s, '__name__', None))" % name)
+        lines += ['    found.append(os.path.join(os.sep, "tmp"))',
+                  '    found.append(math.sqrt(collections.OrderedDict().__len__() + 4))',
+                  '    found.append(re.compile("[a-z]+").match("word").group())',
+                  '    return found',
+                  '']
+        files.append(('import_heavy_%d.py' % i, '\n'.join(lines)))
+    return files
+
+# Micro-benchmarks for --runtime: each one spends its time in a loop of the kind optimizer.py rewrites, and prints a
+# result so that the optimized version can be checked against the original.  The last three only check that code
+# optimizer.py must treat with care (constants written against a keyword, module state that changes, and lookups that
+# are not always made) still runs the same.
+runtime_programs = {
+    'builtin_calls': """
+def checksum(items):
+    total = 0
+    for item in items:
+        if isinstance(item, int) and item > 0:
+            total += len(str(item)) + abs(item - 500) + min(item, 7)
+    return total
+print checksum(range(-1000, 1000) * 150)
+""",
+    'module_attributes': """
+import math, os.path
+def distances(points):
+    total = 0.0
+    names = []
+    for x, y in points:
+        total += math.sqrt(x * x + y * y) + math.floor(math.fabs(x - y))
+        names.append(os.path.join('d', 'f'))
+    return total, len(names)
+print distances([(i % 97, i % 89) for i in range(300000)])
+""",
+    'global_functions': """
+def scale(value):
+    return value * 3
+def clamp(value):
+    return value if value < 1000 else 1000
+def total(count):
+    result = 0
+    i = 0
+    while i < count:
+        result += clamp(scale(i)) - clamp(i)
+        i += 1
+    return result
+print total(500000)
+""",
+    'constant_math': """
+def seconds(days):
+    total = 0
+    for day in days:
+        total += day * (60 * 60 * 24) + (1 << 10) - 1 + day % (2 ** 8)
+    return total
+print seconds(range(1000000))
+""",
+    'mutable_module_state': """
+fileh = open('state_mod.py', 'w')
+fileh.write('counter = 0\\ndef bump():\\n    global counter\\n    counter += 1\\n')
+fileh.close()
+import state_mod, tempfile
+def observe(count):
+    seen = []
+    for i in range(count):
+        state_mod.bump()
+        seen.append(state_mod.counter)
+        seen.append(tempfile.tempdir is None)
+        tempfile.gettempdir()
+    return seen
+print observe(3)
+""",
+    'conditional_lookups': """
+import os, math
+def guarded(xs):
+    for x in xs:
+        if hasattr(os, 'no_such_function'):
+            os.no_such_function(x)
+        if x < 0 and hasattr(math, 'no_such_function'):
+            math.no_such_function(x)
+    return len(xs)
+def uses_later(xs):
+    out = []
+    for x in xs:
+        out.append(later(x))
+    return out
+print guarded([1, 2, 3]), uses_later([])
+def later(x):
+    return -x
+print uses_later([1, 2, 3])
+""",
+    'keyword_parentheses': """
+def hours(count):
+    total = 0
+    for i in range(count):
+        if(2 + 3):
+            total += i * (60 * 60)
+    return(total + 1)
+print(hours(100000))
+print(60 * 60)
+print(-1 + 2)
+""",
+}
+
+def write_corpus(name, scale, directory):
+    """Generates the corpus 'name' into 'directory', returning the paths of its files in order"""
+    paths = []
+    os.mkdir(directory)
+    for filename, source in globals()[name](scale):
+        path = os.path.join(directory, filename)
+        fileh = open(path, 'w')
+        fileh.write(source)
+        fileh.close()
+        paths.append(path)
+    return paths
+
+def count_tokens(paths):
+    """Returns the number of (lines, tokens) in the files at 'paths'"""
+    lines = tokens = 0
+    for path in paths:
+        fileh = open(path, 'r')
+        for token in tokenize.generate_tokens(fileh.readline):
+            tokens += 1
+        fileh.close()
+        lines += token[2][0]
+    return lines, tokens
+
+# Runs the program given as its argument and then prints its peak RSS in megabytes to stderr, after the source of
+# peak_rss_mb()
+peak_rss_wrapper = """import sys, runpy
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+finally:
+    sys.stderr.write('%f\\n' % peak_rss_mb())
+"""
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in megabytes"""
+    # Linux resets VmHWM on exec, whereas ru_maxrss also covers the process this one was forked from
+    try:
+        for line in open('/proc/self/status', 'r'):
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024.0
+    except IOError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1048576.0 # Bytes on Mac OS X, kilobytes elsewhere
+    return peak / 1024.0
+
+def time_tool(tool, paths, repeat):
+    """Runs 'tool' on the files at 'paths' 'repeat' times and returns the best time in seconds"""
+    best = None
+    for i in range(repeat):
+        if tool == 'pyfuscate':
+            import pyfuscate
+            obfu = pyfuscate.pyfuscate(pyfuscate.global_names)
+            obfu.file_out = open(os.devnull, 'w')
+            start = time.time()
+            for path in paths:
+                obfu.file_in = open(path, 'r')
+                obfu.run()
+                obfu.file_in.close()
+            elapsed = time.time() - start
+            obfu.file_out.close()
+        elif tool == 'scope':
+            import pyfuscate
+            start = time.time()
+            obfu = pyfuscate.scope_pyfuscate()
+            obfu.file_out = open(os.devnull, 'w')
+            for path in paths:
+                obfu.file_in = open(path, 'r')
+                obfu.run()
+                obfu.file_in.close()
+            elapsed = time.time() - start
+            obfu.file_out.close()
+        elif tool == 'pyminifier':
+            import pyminifier
+            start = time.time()
+            for path in paths:
+                fileh = open(path, 'r')
+                pyminifier.minify(fileh.read())
+                fileh.close()
+            elapsed = time.time() - start
+        elif tool == 'parallel':
+            import pyminifier
+            start = time.time()
+            for path in paths:
+                fileh = open(path, 'r')
+                pyminifier.minify(fileh.read(), jobs=parallel_jobs)
+                fileh.close()
+            elapsed = time.time() - start
+        elif tool == 'compyne':
+            import compyne
+            out = open(os.devnull, 'w')
+            start = time.time()
+            compyne.compyne(paths, out)
+            elapsed = time.time() - start
+            out.close()
+        elif tool == 'chain':
+            # The three tools in turn, each one parsing the text of the one before
+            import compyne, pyfuscate, pyminifier
+            from cStringIO import StringIO
+            obfu = pyfuscate.pyfuscate(pyfuscate.global_names)
+            start = time.time()
+            merged = StringIO()
+            compyne.compyne(paths, merged)
+            obfu.file_in = StringIO(merged.getvalue())
+            obfu.file_out = StringIO()
+            obfu.run()
+            pyminifier.minify(obfu.file_out.getvalue())
+            elapsed = time.time() - start
+        elif tool == 'pipeline':
+            import pipeline, pyfuscate
+            obfu = pyfuscate.pyfuscate(pyfuscate.global_names)
+            out = open(os.devnull, 'w')
+            start = time.time()
+            for chunk in pipeline.iter_pipeline(paths, True, obfu, True):
+                out.write(chunk)
+            elapsed = time.time() - start
+            out.close()
+        else:
+            import pyfuscate
+            obfu = pyfuscate.pyfuscate(pyfuscate.global_names)
+            out_dir = tempfile.mkdtemp(prefix='pyfuscate-bench-tree-')
+            stderr = sys.stderr
+            sys.stderr = open(os.devnull, 'w') # Not the count of files rewritten
+            try:
+                start = time.time()
+                obfu.run_tree(os.path.dirname(paths[0]), out_dir)
+                elapsed = time.time() - start
+            finally:
+                sys.stderr.close()
+                sys.stderr = stderr
+                shutil.rmtree(out_dir)
+        if best is None or elapsed < best:
+            best = elapsed
+    if tool == 'pyminifier':
+        import pyminifier
+        for path in paths:
+            try:
+                compile(pyminifier.minify(open(path, 'r').read()), path, 'exec')
+            except SyntaxError:
+                raise AssertionError("the minified %s does not compile" % path)
+    if tool == 'parallel':
+        # Split at every top-level statement, as the corpora are mostly too small to be split otherwise, both as
+        # minify() does and as the command line does (streaming through minify_file())
+        import pyminifier, profiler, streaming
+        for path in paths:
+            source = open(path, 'r').read()
+            serial = pyminifier.minify(source)
+            profile = profiler.profiler()
+            if pyminifier.parallel_minify(source, parallel_jobs, profile, chunk_size=1) != serial:
+                raise AssertionError("parallel and serial minify differ on %s" % path)
+            out = tempfile.TemporaryFile('w+')
+            pyminifier.minify_file(streaming.source_file(path), out, profile, parallel_jobs, chunk_size=1)
+            out.seek(0)
+            if out.read() != serial + '\n':
+                raise AssertionError("parallel minify_file and serial minify differ on %s" % path)
+            out.close()
+            if profile.counters.get('parallel fallbacks'):
+                raise AssertionError("%s was minified serially after a failed split, so the parallel output was not checked" % path)
+    return best
+
+def output_sizes(paths):
+    """Returns the size in bytes of the files at 'paths' and of their obfuscated output, with pyfuscate alone and
+    through the whole pipeline, each with and without short names"""
+    import pyfuscate, pipeline
+    from cStringIO import StringIO
+    sizes = {'source': sum(os.path.getsize(path) for path in paths)}
+    for short_names in (False, True):
+        suffix = short_names and ' --short-names' or ''
+        obfu = pyfuscate.pyfuscate(pyfuscate.global_names)
+        obfu.short_names = short_names
+        size = 0
+        for path in paths:
+            obfu.file_in = open(path, 'r')
+            obfu.file_out = StringIO()
+            obfu.run()
+            obfu.file_in.close()
+            size += len(obfu.file_out.getvalue())
+        sizes['pyfuscate' + suffix] = size
+        obfu = pyfuscate.pyfuscate(pyfuscate.global_names)
+        obfu.short_names = short_names
+        sizes['pipeline' + suffix] = sum(len(x) for x in pipeline.iter_pipeline(paths, True, obfu, True))
+    return sizes
+
+cold_start_builds = [('py', 'app.py', None), ('pyc', 'app.pyc', None), ('zipapp', 'app.pyz', None),
+                     ('packed', 'app_zlib.py', 'zlib'), ('packed', 'app_bz2.py', 'bz2')]
+
+def cold_start(paths, directory, repeat):
+    """Writes the pipeline output for the files at 'paths' into 'directory' as each of cold_start_builds (plain
+    source, .pyc, zipapp and packed with zlib and bz2), and returns the best time in seconds of 'repeat' runs of each
+    in a fresh interpreter and of an empty one, and the size in bytes of each"""
+    import pipeline, pyfuscate, artifact
+    obfu = pyfuscate.pyfuscate(pyfuscate.global_names)
+    source = ''.join(pipeline.iter_pipeline(paths, True, obfu, True))
+    commands = {'python -c pass': [sys.executable, '-c', 'pass']}
+    sizes = {'source': sum(os.path.getsize(path) for path in paths)}
+    for kind, filename, compression in cold_start_builds:
+        path = os.path.join(directory, filename)
+        artifact.write_artifact(kind, path, source, compression=compression)
+        commands[filename] = [sys.executable, path]
+        sizes[filename] = os.path.getsize(path)
+    times = dict((name, run_program(command, directory, repeat)[0]) for name, command in commands.items())
+    return times, sizes
+
+def run_program(command, directory, repeat):
+    """Runs 'command' in 'directory' 'repeat' times, returning the best time in seconds and (from one more run) the
+    peak RSS in megabytes of the program, when 'command' runs a Python program"""
+    best = None
+    devnull = open(os.devnull, 'w')
+    for i in range(repeat):
+        start = time.time()
+        if subprocess.call(command, stdout=devnull, cwd=directory):
+            sys.stderr.write("%s exited with an error\n" % ' '.join(command))
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    peak = None
+    if command[1:2] != ['-c']:
+        wrapper = inspect.getsource(peak_rss_mb) + peak_rss_wrapper
+        child = subprocess.Popen([command[0], '-c', wrapper] + command[1:], stdout=devnull, stderr=subprocess.PIPE,
+                                 cwd=directory)
+        peak = float(child.communicate()[1].decode('ascii').split()[-1])
+    devnull.close()
+    return best, peak
+
+def lazy_start(paths, directory, repeat):
+    """Bundles the files at 'paths' with a program that only imports the first of them, through the pipeline both
+    merged and as a lazy bundle, and returns the best time and the peak RSS of running each bundle"""
+    import pipeline, pyfuscate
+    program = os.path.join(directory, 'lazy_main.py')
+    fileh = open(program, 'w')
+    fileh.write('from %s import *\n' % os.path.splitext(os.path.basename(paths[0]))[0])
+    fileh.close()
+    results = {}
+    for name, bundle in (('merged', pipeline.iter_pipeline), ('lazy', pipeline.iter_lazy_pipeline)):
+        path = os.path.join(directory, 'bundle_%s.py' % name)
+        fileh = open(path, 'w')
+        for chunk in bundle(paths + [program], obfu=pyfuscate.pyfuscate(pyfuscate.global_names)):
+            fileh.write(chunk)
+        fileh.close()
+        results[name] = run_program([sys.executable, path], directory, repeat)
+    os.remove(program)
+    return results
+
+def runtime_speedup(programs, directory, repeat):
+    """Writes each of 'programs', a list of (name, source) pairs, into 'directory' as it is and as rewritten by
+    optimizer.py, and returns for each name the best time in seconds of running the two versions and whether they
+    printed the same"""
+    import optimizer
+    results = {}
+    for name, source in programs:
+        times = []
+        outputs = []
+        for suffix, text in (('', source), ('_optimized', optimizer.optimize(source))):
+            path = os.path.join(directory, 'runtime_%s%s.py' % (name, suffix))
+            fileh = open(path, 'w')
+            fileh.write(text)
+            fileh.close()
+            outputs.append(subprocess.Popen([sys.executable, path], stdout=subprocess.PIPE, cwd=directory).communicate()[0])
+            times.append(run_program([sys.executable, path], directory, repeat)[0])
+        results[name] = {'plain': times[0], 'optimized': times[1], 'same_output': outputs[0] == outputs[1]}
+    return results
+
+stream_commands = [('pyminifier', ['pyminifier.py']), ('compyne', ['compyne.py']), ('pyfuscate', ['pyfuscate.py', '-f']),
+                   ('pipeline', ['pipeline.py', '--no-rename'])]
+
+def stream_memory(scale, directory):
+    """Generates the huge_module corpus into 'directory' at 8 and 32 times 'scale' and returns, for each of
+    stream_commands, the size in bytes of the two and the peak RSS in megabytes of running the tool on each"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for factor in (8, 32):
+        paths = write_corpus('huge_module', scale * factor, os.path.join(directory, 'stream_x%d' % factor))
+        for tool, arguments in stream_commands:
+            command = [sys.executable, os.path.join(here, arguments[0])] + arguments[1:] + paths
+            # The tools import each other, so they are run from their own directory
+            peak = run_program(command, here, 1)[1]
+            results.setdefault(tool, []).append((os.path.getsize(paths[0]), peak))
+    return results
+
+def name_cache_hits(directory):
+    """Introspects cache_modules into an empty name cache in 'directory', then looks them all up again through a new
+    cache over the same directory, returning the seconds each pass took.  Fails if any module misses the second time."""
+    import pyfuscate
+    start = time.time()
+    pyfuscate.introspect_modules(cache_modules, pyfuscate.name_cache(directory), parallel_jobs)
+    cold = time.time() - start
+    cache = pyfuscate.name_cache(directory)
+    start = time.time()
+    missed = [name for name in cache_modules if cache.cached(name) is None]
+    cached = time.time() - start
+    if missed:
+        raise AssertionError("the name cache missed on the second pass for: %s" % ', '.join(missed))
+    return cold, cached
+
+def measure(tool, paths, repeat):
+    """Times 'tool' in a child process, returning (seconds, peak RSS in megabytes)"""
+    command = [sys.executable, os.path.abspath(__file__), '--measure', tool, '--repeat', str(repeat)] + paths
+    child = subprocess.Popen(command, stdout=subprocess.PIPE)
+    output = child.communicate()[0]
+    if child.returncode:
+        sys.exit("%s failed on %s" % (tool, os.path.dirname(paths[0])))
+    result = json.loads(output.decode('ascii'))
+    return result['seconds'], result['peak_rss_mb']
+
+def compare(results, baseline, tolerance):
+    """Prints how 'results' compare to 'baseline' and returns the number of regressions beyond 'tolerance'"""
+    regressions = 0
+    if baseline.get('scale') != results['scale']:
+        print "warning: the baseline was run at scale %s, this run at scale %s" % (baseline.get('scale'), results['scale'])
+    for key in sorted(results['results']):
+        old = baseline['results'].get(key)
+        if not old:
+            continue
+        new = results['results'][key]
+        for field in ('seconds', 'peak_rss_mb'):
+            ratio = new[field] / max(old[field], 1e-9)
+            if ratio > 1 + tolerance:
+                regressions += 1
+                print "REGRESSION %-28s %-12s %10.3f -> %10.3f (%+.1f%%)" % (key, field, old[field], new[field], (ratio - 1) * 100)
+            elif ratio < 1 - tolerance:
+                print "improved   %-28s %-12s %10.3f -> %10.3f (%+.1f%%)" % (key, field, old[field], new[field], (ratio - 1) * 100)
+    return regressions
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [OPTION]...')
+    parser.add_option('--scale', action='store', type='int', dest='scale', default=1,
+                      help='Multiply the size of every corpus by SCALE [default=%default]')
+    parser.add_option('--repeat', action='store', type='int', dest='repeat', default=3,
+                      help='Report the best of REPEAT runs [default=%default]')
+    parser.add_option('--corpus', action='store', type='string', dest='corpora', default=','.join(corpora),
+                      help='Comma-separated list of corpora to run [default=%default]')
+    parser.add_option('--tool', action='store', type='string', dest='tools', default=','.join(tools),
+                      help='Comma-separated list of tools to time [default=%default]')
+    parser.add_option('--save', action='store', type='string', dest='save_file', metavar='FILE',
+                      help='Write the results to FILE as a JSON baseline')
+    parser.add_option('--compare', action='store', type='string', dest='baseline_file', metavar='FILE',
+                      help='Compare the results with the JSON baseline in FILE, exiting with status 1 on a regression')
+    parser.add_option('--tolerance', action='store', type='float', dest='tolerance', default=0.1,
+                      help='Fraction by which a time or peak RSS may grow before it is flagged [default=%default]')
+    parser.add_option('--keep', action='store', type='string', dest='keep_dir', metavar='DIR',
+                      help='Generate the corpora in DIR and leave them there')
+    parser.add_option('--sizes', action='store_true', dest='sizes', default=False,
+                      help='Also report the size of the obfuscated output of each corpus, with and without short names')
+    parser.add_option('--cold-start', action='store_true', dest='cold_start', default=False,
+                      help='Also time running the pipeline output of each corpus as source, .pyc and zipapp')
+    parser.add_option('--lazy-start', action='store_true', dest='lazy_start', default=False,
+                      help='Also time running a program that uses one module of each corpus, merged and lazily bundled')
+    parser.add_option('--runtime', action='store_true', dest='runtime', default=False,
+                      help='Also time the pipeline output of each corpus and the runtime_programs with and without --optimize-runtime')
+    parser.add_option('--stream-memory', action='store_true', dest='stream_memory', default=False,
+                      help='Also report the peak RSS of the command-line tools on a very large module at two sizes')
+    parser.add_option('--name-cache', action='store_true', dest='name_cache', default=False,
+                      help='Also time introspecting cache_modules into an empty name cache and again from the cache, '
+                           'failing if any of them is not cached')
+    parser.add_option('--measure', action='store', type='string', dest='measure_tool', help=optparse.SUPPRESS_HELP)
+    (options, args) = parser.parse_args()
+    if options.measure_tool:
+        seconds = time_tool(options.measure_tool, args, options.repeat)
+        sys.stdout.write(json.dumps({'seconds': seconds, 'peak_rss_mb': peak_rss_mb()}))
+        return 0
+    for name in options.corpora.split(','):
+        if name not in corpora:
+            parser.error("unknown corpus '%s'" % name)
+    for tool in options.tools.split(','):
+        if tool not in tools:
+            parser.error("unknown tool '%s'" % tool)
+    baseline = None
+    if options.baseline_file:
+        baseline = json.load(open(options.baseline_file, 'r'))
+    if options.keep_dir:
+        directory = options.keep_dir
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    else:
+        directory = tempfile.mkdtemp(prefix='pyfuscate-bench-')
+    results = {'python': sys.version.split()[0], 'scale': options.scale, 'results': {}}
+    try:
+        print "%-28s %10s %12s %12s %10s" % ('corpus/tool', 'seconds', 'lines/sec', 'tokens/sec', 'peak MB')
+        for name in options.corpora.split(','):
+            corpus_dir = os.path.join(directory, name)
+            if os.path.isdir(corpus_dir):
+                shutil.rmtree(corpus_dir)
+            paths = write_corpus(name, options.scale, corpus_dir)
+            lines, tokens = count_tokens(paths)
+            for tool in options.tools.split(','):
+                seconds, peak = measure(tool, paths, options.repeat)
+                key = '%s/%s' % (name, tool)
+                results['results'][key] = {'seconds': seconds,
+                                           'lines': lines,
+                                           'tokens': tokens,
+                                           'lines_per_sec': lines / max(seconds, 1e-9),
+                                           'tokens_per_sec': tokens / max(seconds, 1e-9),
+                                           'peak_rss_mb': peak}
+                print "%-28s %10.3f %12.0f %12.0f %10.1f" % (key, seconds, lines / max(seconds, 1e-9), tokens / max(seconds, 1e-9), peak)
+            if options.sizes:
+                results.setdefault('sizes', {})[name] = output_sizes(paths)
+            if options.cold_start:
+                times, sizes = cold_start(paths, corpus_dir, options.repeat)
+                results.setdefault('cold_start', {})[name] = times
+                results.setdefault('cold_start_sizes', {})[name] = sizes
+            if options.lazy_start:
+                results.setdefault('lazy_start', {})[name] = lazy_start(paths, corpus_dir, options.repeat)
+            if options.runtime:
+                import pipeline
+                source = ''.join(pipeline.iter_pipeline(paths, obfu=None, minify=False))
+                results.setdefault('runtime', {}).update(runtime_speedup([(name, source)], corpus_dir, options.repeat))
+        if options.runtime:
+            results['runtime'].update(runtime_speedup(sorted(runtime_programs.items()), directory, options.repeat))
+        if options.stream_memory:
+            results['stream_memory'] = stream_memory(options.scale, directory)
+        if options.name_cache:
+            results['name_cache'] = name_cache_hits(os.path.join(directory, 'name_cache'))
+        if options.sizes:
+            print
+            print "%-16s %10s %10s %14s %10s %14s" % ('corpus (bytes)', 'source', 'pyfuscate', '--short-names', 'pipeline', '--short-names')
+            for name in options.corpora.split(','):
+                sizes = results['sizes'][name]
+                print "%-16s %10d %10d %14s %10d %14s" % ((name, sizes['source'], sizes['pyfuscate'],
+                    '%d (%+.0f%%)' % (sizes['pyfuscate --short-names'], 100.0 * sizes['pyfuscate --short-names'] / sizes['pyfuscate'] - 100),
+                    sizes['pipeline'],
+                    '%d (%+.0f%%)' % (sizes['pipeline --short-names'], 100.0 * sizes['pipeline --short-names'] / sizes['pipeline'] - 100)))
+        if options.cold_start:
+            print
+            filenames = [filename for kind, filename, compression in cold_start_builds]
+            print "%-16s %14s" % ('corpus (sec)', 'python -c pass') + ''.join(' %12s' % x for x in filenames)
+            for name in options.corpora.split(','):
+                times = results['cold_start'][name]
+                print "%-16s %14.3f" % (name, times['python -c pass']) + ''.join(' %12.3f' % times[x] for x in filenames)
+            print
+            print "%-16s %14s" % ('corpus (bytes)', 'source') + ''.join(' %12s' % x for x in filenames)
+            for name in options.corpora.split(','):
+                sizes = results['cold_start_sizes'][name]
+                print "%-16s %14d" % (name, sizes['source']) + ''.join(' %12d' % sizes[x] for x in filenames)
+        if options.lazy_start:
+            print
+            print "%-16s %14s %14s %14s %14s" % ('corpus', 'merged (sec)', 'lazy (sec)', 'merged (MB)', 'lazy (MB)')
+            for name in options.corpora.split(','):
+                merged, lazy = results['lazy_start'][name]['merged'], results['lazy_start'][name]['lazy']
+                print "%-16s %14.3f %14.3f %14.1f %14.1f" % (name, merged[0], lazy[0], merged[1], lazy[1])
+        if options.runtime:
+            print
+            print "%-20s %12s %12s %10s %12s" % ('program (sec)', 'plain', 'optimized', 'change', 'same output')
+            for name in options.corpora.split(',') + sorted(runtime_programs):
+                times = results['runtime'][name]
+                print "%-20s %12.3f %12.3f %+9.1f%% %12s" % (name, times['plain'], times['optimized'],
+                    100.0 * times['optimized'] / max(times['plain'], 1e-9) - 100, times['same_output'] and 'yes' or 'NO')
+        if options.stream_memory:
+            print
+            print "%-16s %14s %14s %14s %14s" % ('tool', 'small (bytes)', 'small (MB)', 'large (bytes)', 'large (MB)')
+            for tool, arguments in stream_commands:
+                (small_size, small_peak), (large_size, large_peak) = results['stream_memory'][tool]
+                print "%-16s %14d %14.1f %14d %14.1f" % (tool, small_size, small_peak, large_size, large_peak)
+        if options.name_cache:
+            print
+            print "%-16s %14s %14s" % ('modules', 'cold (sec)', 'cached (sec)')
+            print "%-16d %14.3f %14.3f" % ((len(cache_modules),) + tuple(results['name_cache']))
+    finally:
+        if not options.keep_dir:
+            shutil.rmtree(directory)
+    if options.save_file:
+        fileh = open(options.save_file, 'w')
+        json.dump(results, fileh, indent=1, sort_keys=True)
+        fileh.close()
+    if baseline and compare(results, baseline, options.tolerance):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
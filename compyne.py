@@ -1,28 +1,198 @@
 #!/usr/bin/python
 
-import re, sys
-
-import_line = re.compile("^import.*$", re.S|re.M)
-from_line = re.compile("^from.*$", re.S|re.M)
-all_lines = []
-all_imports = []
-final_string = "#!/usr/bin/python\n"
-
-for i in sys.argv[1:]:
-    fileh = open(i, 'r')
-    lines = fileh.readlines()
-    fileh.close()
+import re, sys, os, optparse
+import streaming
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import_lines = re.compile("^(?:import|from)[ \t].*\n?", re.M)
+future_lines = re.compile("^from[ \t]+__future__[ \t]+import.*\n?", re.M)
+from_parts = re.compile("^from\s+([\w.]+)\s+import\s+(.*)$", re.S)
+
+# The loader at the top of a lazy bundle.  Each bundled module is put in
+# sys.modules with its source, which is only compiled and run the first time
+# one of its attributes is looked up (as 'from' and 'import' then do).
+lazy_loader = """import sys, types
+class _lazy_module(types.ModuleType):
+ def __getattr__(self, name):
+  source = self.__dict__.pop('__lazy_source__', None)
+  if source is None:
+   raise AttributeError(name)
+  exec(compile(source, self.__file__, 'exec'), self.__dict__)
+  return getattr(self, name)
+def _lazy(name, source):
+ module = sys.modules[name] = _lazy_module(name)
+ module.__file__ = name + '.py'
+ module.__lazy_source__ = source
+"""
+
+def module_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def read_file(path):
+    fileh = open(path, 'r')
+    try:
+        return fileh.read()
+    finally:
+        fileh.close()
+
+def scan_imports(lines):
+    """Returns the modules named on the 'import' lines among 'lines', and the
+modules and names from its 'from' lines."""
+    imports = []
+    from_names = []
     for line in lines:
-        if import_line.match(line):
-            items = line.split()
-            for item in items[1:]:
-                all_imports += [x for x in item.split(',') if x and x not in all_imports]
-        elif from_line.match(line):
+        match = import_lines.match(line)
+        if not match:
             continue
+        line = match.group().split('#')[0]
+        if line.startswith('import'):
+            for item in line[len('import'):].split(','):
+                item = ' '.join(item.split())
+                if item:
+                    imports.append(item)
         else:
-            all_lines.append(line)
+            match = from_parts.match(line)
+            if match:
+                from_names.append(match.group(1))
+                names = match.group(2).strip('()\\ \t\r\n')
+                from_names += [x.split()[0] for x in names.split(',') if x.strip()]
+    return imports, from_names
+
+def module_order(paths, deps):
+    """Returns 'paths' sorted so that each file comes after the files it imports
+from (as given in 'deps'), keeping their original order wherever it can.  A
+cycle is broken where it is found, with a warning."""
+    order = []
+    done = set()
+    visiting = set()
+    for path in paths:
+        if path in done:
+            continue
+        # An explicit stack rather than recursion, as chains of imports can be long
+        stack = [(path, iter(deps[path]))]
+        visiting.add(path)
+        while stack:
+            current, pending = stack[-1]
+            for dep in pending:
+                if dep in done:
+                    continue
+                if dep in visiting:
+                    sys.stderr.write("Import cycle between %s and %s\n" % (current, dep))
+                    continue
+                visiting.add(dep)
+                stack.append((dep, iter(deps[dep])))
+                break
+            else:
+                stack.pop()
+                visiting.discard(current)
+                done.add(current)
+                order.append(current)
+    return order
+
+def plan(paths):
+    """Reads the files in 'paths' for their imports, returning the imports of
+all the files together (each once) and the order in which to combine the
+files, so that every module comes after the modules it imports from."""
+    all_imports = []
+    seen_imports = set()
+    modules = {}
+    for path in paths:
+        modules.setdefault(module_name(path), path)
+    deps = {}
+    for path in paths:
+        source = streaming.source_file(path)
+        imports, from_names = scan_imports(source)
+        source.close()
+        for item in imports:
+            if item not in seen_imports:
+                seen_imports.add(item)
+                all_imports.append(item)
+        deps[path] = []
+        for name in from_names:
+            dep = modules.get(name.split('.')[-1])
+            if dep and dep != path and dep not in deps[path]:
+                deps[path].append(dep)
+    return all_imports, module_order(paths, deps)
+
+def iter_compyne(all_imports, order, read=None, chunk_size=65536):
+    """Generator that yields the combined source, as planned by plan(), in chunks
+of about 'chunk_size' characters after the shebang and the single 'import'
+line.  The files are read a line at a time, unless 'read' is given: then each
+file's source is got by calling it with the file's path."""
+    yield "#!/usr/bin/python\n"
+    if all_imports:
+        yield "import "+', '.join(all_imports)+"\n"
+    for path in order:
+        if read:
+            lines = StringIO(read(path))
+        else:
+            lines = streaming.source_file(path)
+        buffered = []
+        size = 0
+        last = '\n'
+        for line in lines:
+            if import_lines.match(line):
+                continue
+            buffered.append(line)
+            size += len(line)
+            last = line
+            if size >= chunk_size:
+                yield ''.join(buffered)
+                buffered = []
+                size = 0
+        lines.close()
+        if not last.endswith('\n'):
+            # Keep the next file from running on from this one's last line
+            buffered.append('\n')
+        if buffered:
+            yield ''.join(buffered)
+
+def iter_lazy_compyne(modules, main_source):
+    """Generator that yields a lazy bundle of 'modules', a list of (name, source)
+pairs, which runs 'main_source'.  Unlike the combined source, each module keeps
+its own namespace and its own imports, and its body only runs when the program
+first uses it."""
+    yield "#!/usr/bin/python\n"
+    # 'from __future__' has to come before anything else
+    for match in future_lines.finditer(main_source):
+        yield match.group().rstrip('\n') + '\n'
+    yield lazy_loader
+    for name, source in modules:
+        yield "_lazy(%r, %r)\n" % (name, source)
+    yield "del _lazy_module, _lazy\n"
+    yield future_lines.sub('', main_source)
+
+def lazy_compyne(paths, out):
+    """Writes a lazy bundle of the source files in 'paths' to the file object
+'out'.  The last file is the program, which runs as it is; the others are
+loaded as modules when it first uses them."""
+    modules = [(module_name(path), read_file(path)) for path in paths[:-1]]
+    for piece in iter_lazy_compyne(modules, read_file(paths[-1])):
+        out.write(piece)
+
+def compyne(paths, out):
+    """Combines the source files in 'paths' into one, written to the file object
+'out' a piece at a time, with a single 'import' line at the top and the 'from'
+imports left out.  The files are read once to gather their imports, and again
+to copy them across in the order given by plan(), a line at a time, so that
+no file is ever held in memory whole."""
+    all_imports, order = plan(paths)
+    for piece in iter_compyne(all_imports, order):
+        out.write(piece)
+    out.write("\n")
 
-import_string = ', '.join(all_imports)
-temp_string = ''.join(all_lines)
-final_string += "import "+import_string+"\n"+temp_string
-print final_string
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage='%prog [--lazy] FILE...')
+    parser.add_option('--lazy',
+                      action='store_true',
+                      dest='lazy',
+                      help='Bundle the files as modules that are only loaded when first used, running the last file given',
+                      default=False)
+    (options, args) = parser.parse_args()
+    if options.lazy:
+        lazy_compyne(args, sys.stdout)
+    else:
+        compyne(args, sys.stdout)
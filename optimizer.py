@@ -0,0 +1,422 @@
+#!/usr/bin/python
+
+"""
+Optimizer:  Rewrites Python source to run faster before it is obfuscated.
+
+Renaming and minifying leave a program running exactly as fast as before.
+This stage, which pyfuscate.py and pipeline.py run with --optimize-runtime,
+makes two kinds of change to the source:
+
+    Constant expressions made only of numbers, such as 60 * 60 * 24, are
+    folded into their value.  '/' is left alone, as what it does depends on
+    'from __future__ import division', and so are powers and shifts that
+    could grow large.
+
+    In functions with loops, the builtins and the attributes of imported
+    extension modules (math.sqrt) that are read inside the loops are looked
+    up once, into local aliases at the top of the function, rather than on
+    every pass.
+
+A lookup is only hoisted where it cannot change and cannot fail when it is
+made early.  A builtin is hoisted only if the module binds its name nowhere
+(a builtin the module shadows, even through a 'global' statement, is left
+alone), and always exists.  The module's own functions and classes are not
+hoisted, as a function may run before they are bound.  An attribute chain is
+hoisted only from a module written in C (found with imp.find_module(), without
+importing it), other than sys, since only Python code can rebind the globals
+of a Python module (as a module does when one of its functions changes a
+counter).  The chain must also be read every time through the body of a loop
+that every call of the function reaches, rather than behind an 'if', an 'and'
+or 'or', a conditional expression or a statement that may leave the block
+first, and nothing in the module may assign to an attribute of that module.
+Everything in a module with 'from ... import *' is left alone, as are
+functions with nested scopes or that use exec, eval(), locals(), vars() or
+globals().  Imported modules are taken not to be patched by other modules
+while such a function runs, and a chain read in a loop to exist even when the
+loop runs no times.
+
+On its own, this prints the optimized version of a file:
+
+    optimizer.py myscript.py > myscript_fast.py
+"""
+
+import sys, imp, tokenize, ast, symtable, __builtin__
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+fold_operators = set(['+', '-', '*', '//', '%', '**', '<<', '>>', '&', '|', '^', '~', '(', ')'])
+comparisons = ['<', '>', '==', '>=', '<=', '<>', '!=']
+# A constant expression is only folded between tokens that bind less tightly
+# than any arithmetic, so that it is a whole subexpression.
+fold_before = set(['(', '[', '{', ',', ':', '=', ';', '+=', '-=', '*=', '/=', '//=', '%=', '**=', '>>=', '<<=',
+                   '&=', '|=', '^=', 'return', 'yield', 'print', 'and', 'or', 'not', 'in', 'is', 'if', 'else',
+                   'elif', 'while', 'assert'] + comparisons)
+fold_after = set([')', ']', '}', ',', ':', ';', 'if', 'else', 'and', 'or', 'for', 'in', 'is', 'not'] + comparisons)
+dynamic_names = set(['locals', 'vars', 'eval', 'globals', 'exec', 'execfile'])
+constant_names = set(['None']) # Already compiled as a constant
+scope_nodes = (ast.FunctionDef, ast.ClassDef, ast.Lambda, ast.GeneratorExp, ast.SetComp, ast.DictComp)
+block_nodes = (ast.If, ast.While, ast.For, ast.With, ast.TryExcept, ast.TryFinally, ast.FunctionDef, ast.ClassDef)
+exit_nodes = (ast.Break, ast.Continue, ast.Return, ast.Raise)
+mutable_modules = set(['sys', '__builtin__', '__main__', 'imp']) # C modules whose attributes are set by Python code
+
+def fold_edits(tokens):
+    """Returns the (start, end, text) edits that fold the constant expressions
+among 'tokens' (as produced by tokenize.generate_tokens())."""
+    edits = []
+    tokens = [x for x in tokens if x[0] not in (tokenize.COMMENT, tokenize.NL)]
+    previous = None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        after_delimiter = previous is None or previous[0] in (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT) \
+                          or (previous[0] in (tokenize.OP, tokenize.NAME) and previous[1] in fold_before)
+        previous = token
+        if not after_delimiter or not (token[0] == tokenize.NUMBER or token[1] in ('(', '-', '+', '~')):
+            i += 1
+            continue
+        depth = 0
+        j = i
+        while j < len(tokens):
+            tok_type, tok_string = tokens[j][0], tokens[j][1]
+            if tok_type == tokenize.NUMBER and tok_string[-1] not in 'jJ':
+                pass
+            elif tok_type == tokenize.OP and tok_string in fold_operators:
+                if tok_string == '(':
+                    depth += 1
+                elif tok_string == ')':
+                    if not depth:
+                        break
+                    depth -= 1
+            else:
+                break
+            j += 1
+        run = tokens[i:j]
+        if depth or j == len(tokens) or len(run) < 2 or (len(run) == 2 and run[0][1] != '('):
+            i += 1
+            continue
+        following = tokens[j]
+        if following[0] not in (tokenize.NEWLINE, tokenize.ENDMARKER) and following[1] not in fold_after:
+            i += 1
+            continue
+        literal = fold_run(run)
+        if literal is not None:
+            if i and tokens[i - 1][0] == tokenize.NAME and tokens[i - 1][3] == run[0][2]:
+                # Keep the literal apart from a keyword written against it, as in 'return(1 + 2)'
+                literal = '(%s)' % literal
+            edits.append((run[0][2], run[-1][3], literal))
+            previous = run[-1]
+            i = j
+        else:
+            i += 1
+    return edits
+
+def fold_run(run):
+    """Returns the value of the constant expression made up of the tokens in
+'run' as a literal, or None if it should not be folded."""
+    strings = [x[1] for x in run]
+    if strings.count('**') + strings.count('<<') > 1:
+        return None
+    try:
+        if '**' in strings or '<<' in strings:
+            # Keep powers and shifts small enough to evaluate and to be worth writing out
+            for tok_type, tok_string in [x[:2] for x in run]:
+                if tok_type == tokenize.NUMBER and abs(eval(tok_string, {'__builtins__': {}})) > 64:
+                    return None
+        value = eval(' '.join(strings), {'__builtins__': {}})
+    except Exception:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, long, float)):
+        return None
+    if isinstance(value, float) and (value != value or value in (float('inf'), float('-inf'))):
+        return None
+    literal = repr(value)
+    if len(literal) > len(''.join(strings)):
+        return None
+    return literal
+
+def module_bindings(tree):
+    """Returns how each name is bound at the top level of the module 'tree', as
+a dictionary of lists of 'definition' (a def or class statement), 'import',
+'from' and 'other' (anything else, or any binding under a compound statement),
+and whether the module has a 'from ... import *'."""
+    bindings = {}
+    star = False
+    for statement in tree.body:
+        if isinstance(statement, (ast.FunctionDef, ast.ClassDef)):
+            bindings.setdefault(statement.name, []).append('definition')
+            continue
+        if isinstance(statement, (ast.Import, ast.ImportFrom)):
+            for alias in statement.names:
+                if alias.name == '*':
+                    star = True
+                elif isinstance(statement, ast.Import):
+                    bindings.setdefault(alias.asname or alias.name.split('.')[0], []).append('import')
+                else:
+                    bindings.setdefault(alias.asname or alias.name, []).append('from')
+            continue
+        nodes = [statement]
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                bindings.setdefault(node.name, []).append('other')
+                continue
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                for alias in node.names:
+                    if alias.name == '*':
+                        star = True
+                    else:
+                        bindings.setdefault(alias.asname or alias.name.split('.')[0], []).append('other')
+                continue
+            if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+                bindings.setdefault(node.id, []).append('other')
+            if not isinstance(node, scope_nodes):
+                nodes.extend(ast.iter_child_nodes(node))
+    return bindings, star
+
+def extension_module(name):
+    """Returns whether the top-level module 'name' is written in C, going by
+where it would be imported from."""
+    try:
+        fileh, path, description = imp.find_module(name)
+    except ImportError:
+        return False
+    if fileh:
+        fileh.close()
+    return description[2] in (imp.C_EXTENSION, imp.C_BUILTIN)
+
+def evaluated_nodes(node):
+    """Returns the nodes of the expression or simple statement 'node' that are
+evaluated every time it is: all but the branches of conditional expressions,
+the operands of 'and', 'or' and chained comparisons after the first that may be
+skipped, and the parts of a list comprehension run for each item."""
+    nodes = []
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        nodes.append(node)
+        if isinstance(node, ast.BoolOp):
+            pending.append(node.values[0])
+        elif isinstance(node, ast.IfExp):
+            pending.append(node.test)
+        elif isinstance(node, ast.Compare):
+            pending.extend([node.left, node.comparators[0]])
+        elif isinstance(node, ast.ListComp):
+            pending.append(node.generators[0].iter)
+        elif isinstance(node, ast.Assert):
+            pending.append(node.test)
+        else:
+            pending.extend(ast.iter_child_nodes(node))
+    return nodes
+
+def unconditional_nodes(statements):
+    """Returns the nodes that are evaluated every time the block 'statements'
+runs: those of its statements up to the first that may leave the block or has
+a block of its own, of which only the test of an if or while statement, the
+iterable of a for loop and the context of a with statement count."""
+    nodes = []
+    for statement in statements:
+        if isinstance(statement, (ast.If, ast.While)):
+            nodes.extend(evaluated_nodes(statement.test))
+        elif isinstance(statement, ast.For):
+            nodes.extend(evaluated_nodes(statement.iter))
+        elif isinstance(statement, ast.With):
+            nodes.extend(evaluated_nodes(statement.context_expr))
+        elif not isinstance(statement, block_nodes):
+            nodes.extend(evaluated_nodes(statement))
+        if isinstance(statement, block_nodes + exit_nodes):
+            break
+    return nodes
+
+def hoist_edits(source, tokens):
+    """Returns the (start, end, text) edits that hoist the builtin and module
+attribute lookups inside the loops of the functions in 'source' into local
+aliases.  'tokens' are the tokens of 'source'."""
+    tree = compile(source, '<optimizer>', 'exec', ast.PyCF_ONLY_AST)
+    table = symtable.symtable(source, '<optimizer>', 'exec')
+    functions = {}
+    rebound = set()
+    tables = [table]
+    while tables:
+        scope = tables.pop()
+        tables.extend(scope.get_children())
+        if scope.get_type() == 'function':
+            functions[(scope.get_name(), scope.get_lineno())] = scope
+            rebound.update(x.get_name() for x in scope.get_symbols() if x.is_declared_global() and x.is_assigned())
+    bindings, star = module_bindings(tree)
+    if star:
+        return []
+    builtins = set()
+    for name in dir(__builtin__):
+        if name not in bindings and name not in rebound and name not in dynamic_names | constant_names \
+           and name[:2] != '__':
+            builtins.add(name)
+    modules = set()
+    for statement in tree.body:
+        if isinstance(statement, ast.Import):
+            for alias in statement.names:
+                name = alias.asname or alias.name
+                if '.' not in alias.name and bindings.get(name) == ['import'] and name not in rebound \
+                   and alias.name not in mutable_modules and extension_module(alias.name):
+                    modules.add(name)
+    assigned_modules = set()
+    for x in ast.walk(tree):
+        if isinstance(x, ast.Attribute) and not isinstance(x.ctx, ast.Load):
+            while isinstance(x, ast.Attribute):
+                x = x.value
+            if isinstance(x, ast.Name):
+                assigned_modules.add(x.id)
+    positions = dict((x[2], i) for i, x in enumerate(tokens))
+    lines = source.splitlines(True)
+    names = set(x[1] for x in tokens if x[0] == tokenize.NAME)
+    edits = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        scope = functions.get((node.name, node.lineno))
+        body_nodes = []
+        for statement in node.body:
+            body_nodes.extend(ast.walk(statement))
+        if scope is None or [x for x in body_nodes if isinstance(x, scope_nodes)]:
+            continue
+        if dynamic_names.intersection(x.get_name() for x in scope.get_symbols()) or scope.has_exec():
+            continue
+        first = node.body[0]
+        if isinstance(first, ast.Expr) and isinstance(first.value, ast.Str):
+            if len(node.body) < 2:
+                continue
+            first = node.body[1]
+        indent = lines[first.lineno - 1][:first.col_offset]
+        if indent.strip():
+            continue
+        in_loops = {}
+        for loop in body_nodes:
+            if isinstance(loop, (ast.For, ast.While)):
+                parts = loop.body + (isinstance(loop, ast.While) and [loop.test] or [])
+                for part in parts:
+                    for x in ast.walk(part):
+                        in_loops[id(x)] = x
+        # Attribute chains are only hoisted from the loops that every call reaches
+        always_read = {}
+        for statement in node.body:
+            if isinstance(statement, ast.For):
+                always_read.update((id(x), x) for x in unconditional_nodes(statement.body))
+            elif isinstance(statement, ast.While):
+                always_read.update((id(x), x) for x in evaluated_nodes(statement.test) + unconditional_nodes(statement.body))
+            if [x for x in ast.walk(statement) if isinstance(x, (ast.Return, ast.Raise))]:
+                break
+        # In source order, so that the same input always gives the same output
+        in_loops = sorted(in_loops.values(), key=lambda x: (getattr(x, 'lineno', 0), getattr(x, 'col_offset', 0)))
+        always_read = sorted(always_read.values(), key=lambda x: (getattr(x, 'lineno', 0), getattr(x, 'col_offset', 0)))
+        inner = set(id(x.value) for x in always_read if isinstance(x, ast.Attribute))
+        aliases = {}
+        taken = set(names) # The aliases are local, so only need to be unique in each function
+        order = []
+        replaced = []
+        chain_roots = set()
+        for x in always_read:
+            if not isinstance(x, ast.Attribute) or id(x) in inner or not isinstance(x.ctx, ast.Load):
+                continue
+            chain = []
+            root = x
+            while isinstance(root, ast.Attribute):
+                chain.insert(0, root.attr)
+                root = root.value
+            if not isinstance(root, ast.Name) or root.id not in modules or root.id in assigned_modules:
+                continue
+            if not scope.lookup(root.id).is_global():
+                continue
+            span = chain_span(tokens, positions, (root.lineno, root.col_offset), [root.id] + chain)
+            if span is None:
+                continue
+            dotted = '.'.join([root.id] + chain)
+            if dotted not in aliases:
+                aliases[dotted] = unique_alias('_' + '_'.join([root.id] + chain), taken)
+                order.append(dotted)
+            replaced.append((span[0], span[1], aliases[dotted]))
+            chain_roots.add(id(root))
+        for x in in_loops:
+            if not isinstance(x, ast.Name) or not isinstance(x.ctx, ast.Load) or id(x) in chain_roots:
+                continue
+            if x.id not in builtins or not scope.lookup(x.id).is_global():
+                continue
+            start = (x.lineno, x.col_offset)
+            if start not in positions or tokens[positions[start]][1] != x.id:
+                continue
+            if x.id not in aliases:
+                aliases[x.id] = unique_alias('_' + x.id, taken)
+                order.append(x.id)
+            replaced.append((start, (x.lineno, x.col_offset + len(x.id)), aliases[x.id]))
+        if not order:
+            continue
+        assignment = '%s = %s' % (', '.join([aliases[x] for x in order]), ', '.join(order))
+        edits.append(((first.lineno, first.col_offset), (first.lineno, first.col_offset), assignment + '\n' + indent))
+        edits.extend(replaced)
+    return edits
+
+def chain_span(tokens, positions, start, names):
+    """Returns the (start, end) of the dotted name made up of 'names' whose
+first token is at 'start', or None if the tokens there do not spell it out."""
+    if start not in positions:
+        return None
+    i = positions[start]
+    end = None
+    for n, name in enumerate(names):
+        if n:
+            while tokens[i][0] in (tokenize.NL, tokenize.COMMENT):
+                i += 1
+            if tokens[i][1] != '.':
+                return None
+            i += 1
+            while tokens[i][0] in (tokenize.NL, tokenize.COMMENT):
+                i += 1
+        if tokens[i][0] != tokenize.NAME or tokens[i][1] != name:
+            return None
+        end = tokens[i][3]
+        i += 1
+    return start, end
+
+def unique_alias(name, taken):
+    """Returns 'name', with underscores added until it is not in 'taken', and adds it there."""
+    while name in taken:
+        name += '_'
+    taken.add(name)
+    return name
+
+def apply_edits(source, edits):
+    """Returns 'source' with the (start, end, text) 'edits' made, where start and
+end are (row, column) positions as given by the tokenize module."""
+    offsets = [0]
+    for line in source.splitlines(True):
+        offsets.append(offsets[-1] + len(line))
+    pieces = []
+    position = len(source)
+    for start, end, text in sorted(edits, reverse=True):
+        start = offsets[start[0] - 1] + start[1]
+        end = offsets[end[0] - 1] + end[1]
+        if end > position:
+            continue # Overlaps an edit already made
+        pieces.append(source[end:position])
+        pieces.append(text)
+        position = start
+    pieces.append(source[:position])
+    pieces.reverse()
+    return ''.join(pieces)
+
+def optimize(source):
+    """Returns 'source' with its constant expressions folded and the lookups in
+its loops hoisted, or unchanged if it cannot be parsed."""
+    try:
+        tokens = list(tokenize.generate_tokens(StringIO(source).readline))
+        source = apply_edits(source, fold_edits(tokens))
+        tokens = list(tokenize.generate_tokens(StringIO(source).readline))
+        return apply_edits(source, hoist_edits(source, tokens))
+    except (tokenize.TokenError, SyntaxError):
+        return source
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.stderr.write("usage: optimizer.py FILE\n")
+        sys.exit(2)
+    sys.stdout.write(optimize(open(sys.argv[1], 'r').read()))
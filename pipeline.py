@@ -0,0 +1,332 @@
+#!/usr/bin/python
+
+"""
+Pipeline:  Runs compyne, pyfuscate and pyminifier as one pass in one process.
+
+Run one after the other, the three tools hand their output to each other as
+text, and every one of them parses it again.  Here the merged source from
+compyne is tokenized once, and the token stream goes through pyfuscate's
+renaming and then pyminifier's token filters before it is written out, a
+chunk at a time.  Any of the stages can be left out:
+
+    pipeline.py /myproj/lib/*.py /myproj/main.py -o /myproj/shipped.py
+    pipeline.py --no-rename -o minified.py main.py
+
+The input files are read a line at a time (see streaming.py), and the output
+is the same as that of running the tools in turn.
+
+With --lazy the files are not merged but bundled as by 'compyne.py --lazy',
+each one renamed and minified on its own.  One rename map covers all of them,
+so the names they import from each other still match.
+
+With --optimize-runtime each file is first rewritten by optimizer.py to run
+faster, before the rest of the pipeline sees it.
+"""
+
+import sys, os, optparse, tokenize, itertools
+import compyne, pyfuscate, pyminifier, profiler, artifact, optimizer, streaming
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+def iter_lines(pieces):
+    """Generator that splits the text 'pieces' into lines."""
+    for piece in pieces:
+        for line in piece.splitlines(True):
+            yield line
+
+def optimized_reader(paths, profile=profiler.null):
+    """Returns a function that gives the source of each of the files in 'paths'
+as rewritten by optimizer.py.  Each file is only optimized once."""
+    profile.start('optimize')
+    sources = dict((path, optimizer.optimize(compyne.read_file(path))) for path in paths)
+    profile.stop('optimize')
+    return sources.get
+
+def iter_pipeline(paths, merge=True, obfu=None, minify=True, profile=profiler.null, chunk_size=65536, optimize=False):
+    """Generator that yields the output of the pipeline over the files in 'paths'
+in chunks of about 'chunk_size' characters.  The files are optimized first if
+'optimize' is set, combined if 'merge' is set (otherwise there must be just
+one), renamed by the pyfuscate object 'obfu' if one is given, and minified if
+'minify' is set."""
+    optimized = None
+    if optimize:
+        optimized = optimized_reader(paths, profile)
+    read = optimized or compyne.read_file
+    fileh = None
+    if merge:
+        profile.start('plan')
+        all_imports, order = compyne.plan(paths)
+        profile.stop('plan')
+        pieces = compyne.iter_compyne(all_imports, order, optimized)
+        import_names = pyfuscate.scan_imports(iter(["import "+', '.join(all_imports)+"\n"]).next)
+    else:
+        if optimize:
+            fileh = StringIO(read(paths[0]))
+        else:
+            fileh = streaming.source_file(paths[0])
+        first_lines = [fileh.readline(), fileh.readline()]
+        pieces = itertools.chain(first_lines, fileh)
+        import_names = None
+    if not obfu and not minify:
+        for piece in pieces:
+            yield piece
+        if merge:
+            yield "\n" # As compyne.py prints it
+        else:
+            fileh.close()
+        return
+    if merge or obfu:
+        header = ["#!/usr/bin/python\n"]
+    else:
+        header = pyminifier.preserved_header(first_lines)
+    if isinstance(obfu, pyfuscate.scope_pyfuscate):
+        # The scopes are found from the whole source, and nothing is imported
+        if merge:
+            obfu.add_source(''.join(iter_lines(compyne.iter_compyne(all_imports, order, optimized))))
+        else:
+            obfu.add_source(read(paths[0]), paths[0])
+    elif obfu:
+        if import_names is None:
+            # The passes before the real one read the same file, and then start it over
+            import_names = pyfuscate.scan_imports(fileh.readline)
+            fileh.seek(0)
+            pieces = fileh
+        profile.start('prefetch_imports')
+        import_names = [x for x in import_names if x not in obfu.known_names]
+        obfu.introspected = pyfuscate.introspect_modules(import_names, obfu.cache, obfu.jobs, obfu.import_timeout)
+        profile.count('modules introspected', len(import_names))
+        profile.stop('prefetch_imports')
+    if obfu and obfu.short_names:
+        # Counting the names takes a pass of its own over the input
+        profile.start('plan_short_names')
+        if merge:
+            obfu.plan_short_names(iter_lines(compyne.iter_compyne(all_imports, order, optimized)).next)
+        else:
+            obfu.plan_short_names(fileh.readline)
+            fileh.seek(0)
+            pieces = fileh
+        profile.stop('plan_short_names')
+    tokens = profile.counted('tokens', profile.timed('tokenize', tokenize.generate_tokens(iter_lines(pieces).next)))
+    if obfu:
+        tokens = profile.timed('rename_tokens', obfu.rename_tokens(tokens))
+    if minify:
+        output = pyminifier.minify_tokens(tokens, profile)
+    else:
+        output = profile.timed('format_tokens', obfu.layout_tokens(tokens))
+    buffered = header
+    size = 0
+    for piece in output:
+        buffered.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffered)
+            buffered = []
+            size = 0
+    if buffered:
+        yield ''.join(buffered)
+    if fileh:
+        fileh.close()
+
+def iter_lazy_pipeline(paths, obfu=None, minify=True, profile=profiler.null, optimize=False):
+    """Generator that yields a lazy bundle (see compyne.iter_lazy_compyne) of the
+files in 'paths', which runs the last of them.  Each file is optimized if
+'optimize' is set, renamed by the pyfuscate object 'obfu' if one is given and
+minified if 'minify' is set.  As in
+pyfuscate's -d mode, the files are renamed once to build the rename map for
+all of them, and again against the finished map for the output, so that a name
+is treated the same way everywhere."""
+    names = [compyne.module_name(path) for path in paths]
+    read = compyne.read_file
+    if optimize:
+        read = optimized_reader(paths, profile)
+    if obfu:
+        # The modules keep their imports, and their names are not renamed
+        obfu.keep_from_imports = True
+        obfu.known_names.merge(names)
+    if isinstance(obfu, pyfuscate.scope_pyfuscate):
+        for path in paths:
+            obfu.add_source(read(path), path)
+    elif obfu:
+        profile.start('prefetch_imports')
+        import_names = pyfuscate.name_registry()
+        for path in paths:
+            # From the same source, optimized or not, that is renamed below
+            import_names.merge(pyfuscate.scan_imports(StringIO(read(path)).readline))
+        import_names = [x for x in import_names if x not in obfu.known_names]
+        obfu.introspected = pyfuscate.introspect_modules(import_names, obfu.cache, obfu.jobs, obfu.import_timeout)
+        profile.count('modules introspected', len(import_names))
+        profile.stop('prefetch_imports')
+        for name in import_names:
+            obfu.rename_dotted(name.split('.'), True)
+    if obfu:
+        if obfu.short_names:
+            profile.start('plan_short_names')
+            obfu.plan_short_names(iter_lines(read(path) for path in paths).next)
+            profile.stop('plan_short_names')
+        profile.start('scan')
+        for path in paths:
+            for token in obfu.rename_tokens(tokenize.generate_tokens(StringIO(read(path)).readline)):
+                pass
+        profile.stop('scan')
+    sources = []
+    for path in paths:
+        if not obfu and not minify:
+            sources.append(read(path))
+            continue
+        tokens = profile.counted('tokens', profile.timed('tokenize', tokenize.generate_tokens(StringIO(read(path)).readline)))
+        if obfu:
+            tokens = profile.timed('rename_tokens', obfu.rename_tokens(tokens))
+        if minify:
+            output = pyminifier.minify_tokens(tokens, profile)
+        else:
+            output = profile.timed('format_tokens', obfu.layout_tokens(tokens))
+        sources.append(''.join(output))
+    for piece in compyne.iter_lazy_compyne(zip(names[:-1], sources[:-1]), sources[-1]):
+        yield piece
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [OPTION]... FILE...')
+    parser.add_option('-o',
+                      '--output',
+                      action='store',
+                      type='string',
+                      dest='output_file',
+                      metavar='FILE',
+                      help='The FILE to write the output to [default=stdout]',
+                      default='')
+    parser.add_option('--no-merge',
+                      action='store_false',
+                      dest='merge',
+                      help='Do not combine the input files with compyne (only one may be given)',
+                      default=True)
+    parser.add_option('--lazy',
+                      action='store_true',
+                      dest='lazy',
+                      help='Bundle the files as modules that are only loaded when first used, running the last file given',
+                      default=False)
+    parser.add_option('--no-rename',
+                      action='store_false',
+                      dest='rename',
+                      help='Do not obfuscate the names with pyfuscate',
+                      default=True)
+    parser.add_option('--no-minify',
+                      action='store_false',
+                      dest='minify',
+                      help='Do not minify the output with pyminifier',
+                      default=True)
+    parser.add_option('-c',
+                      '--count',
+                      action='store',
+                      type='int',
+                      dest='count_index',
+                      help='Specify a starting value for the name counter',
+                      default=0)
+    parser.add_option('-p',
+                      '--preserve-names',
+                      action='store',
+                      type='string',
+                      dest='preserve_names',
+                      help='Specify a space-delimited list of special names to preserve',
+                      default='')
+    parser.add_option('--short-names',
+                      action='store_true',
+                      dest='short_names',
+                      help='Give the most used names the shortest replacements',
+                      default=False)
+    parser.add_option('--engine',
+                      action='store',
+                      type='choice',
+                      choices=pyfuscate.engines,
+                      dest='engine',
+                      help='Rename every name that is not known from the builtins and imported modules (names), or only the names the source binds, found from its scopes without importing anything (scope) [default=%default]',
+                      default='names')
+    parser.add_option('--cache-dir',
+                      action='store',
+                      type='string',
+                      dest='cache_dir',
+                      metavar='DIR',
+                      help='Cache the names found in imported modules under DIR [default=%default]',
+                      default=pyfuscate.default_cache_dir())
+    parser.add_option('--no-cache',
+                      action='store_false',
+                      dest='use_cache',
+                      help='Always import modules to find their names, ignoring the cache',
+                      default=True)
+    parser.add_option('-j',
+                      '--jobs',
+                      action='store',
+                      type='int',
+                      dest='jobs',
+                      help='Number of worker processes used to introspect imported modules, 0 to import them in-process [default=%default]',
+                      default=pyfuscate.default_jobs)
+    parser.add_option('--import-timeout',
+                      action='store',
+                      type='float',
+                      dest='import_timeout',
+                      metavar='SECONDS',
+                      help='Give up on a module that takes longer than SECONDS to introspect [default=%default]',
+                      default=30.0)
+    parser.add_option('--optimize-runtime',
+                      action='store_true',
+                      dest='optimize_runtime',
+                      help='Fold constant expressions and hoist the global, builtin and module attribute lookups in loops into locals before renaming (see optimizer.py)',
+                      default=False)
+    artifact.add_options(parser)
+    parser.add_option('--profile',
+                      action='store',
+                      type='string',
+                      dest='profile_file',
+                      metavar='FILE',
+                      help='Write the time spent in each stage, and counts of tokens, names and modules, to FILE as JSON',
+                      default='')
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("at least one input file must be given")
+    if not options.merge and len(args) > 1:
+        parser.error("only one input file can be given with --no-merge")
+    if options.lazy and not options.merge:
+        parser.error("--lazy cannot be used with --no-merge")
+    if options.artifact != 'py' and not options.output_file:
+        parser.error("an output file must be given with -o when using --artifact")
+    artifact.check_options(parser, options)
+    profile = profiler.null
+    if options.profile_file:
+        profile = profiler.profiler()
+    obfu = None
+    if options.rename:
+        if options.engine == 'scope':
+            obfu = pyfuscate.scope_pyfuscate(profile=profile)
+        else:
+            obfu = pyfuscate.pyfuscate(pyfuscate.global_names, profile=profile)
+        if options.use_cache:
+            obfu.cache = pyfuscate.name_cache(options.cache_dir)
+        obfu.jobs = options.jobs
+        obfu.import_timeout = options.import_timeout
+        obfu.counter = options.count_index
+        obfu.short_names = options.short_names
+        obfu.known_names.merge(options.preserve_names.split())
+    if options.lazy:
+        chunks = iter_lazy_pipeline(args, obfu, options.minify, profile, options.optimize_runtime)
+    else:
+        chunks = iter_pipeline(args, options.merge, obfu, options.minify, profile, optimize=options.optimize_runtime)
+    if options.artifact != 'py':
+        output = ''.join(chunks)
+        artifact.write_artifact(options.artifact, options.output_file, output, options.optimize, options.compression,
+                                options.compress_level)
+        if options.artifact == 'packed':
+            artifact.report_sizes(options.output_file, sum(os.path.getsize(x) for x in args), len(output), 'processed')
+    else:
+        out = sys.stdout
+        if options.output_file:
+            out = open(options.output_file, 'w')
+        for chunk in chunks:
+            out.write(chunk)
+        if out is not sys.stdout:
+            out.close()
+    if options.profile_file:
+        profile.write(options.profile_file)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+
+"""
+Profiler:  Named stage timers and counters for pyfuscate and pyminifier.
+
+The tools take a profiler object and report each stage they run to it.  By
+default they are given the shared null_profiler, 'null', whose methods do
+nothing and whose wrappers hand back the iterables they are given, so the
+instrumentation costs next to nothing unless a real profiler is passed in
+(with --profile).
+
+Stage timers are exclusive: the time spent in a stage started or pulled from
+inside another one is only counted for the inner stage, so the timers add up
+to no more than the wall time of the run.
+"""
+
+import time, json
+
+class profiler:
+    """Collects stage times and counts, and writes them out as a JSON report."""
+
+    enabled = True
+
+    def __init__(self):
+        self.created = time.time()
+        self.timers = {}
+        self.counters = {}
+        self.stack = []
+
+    def start(self, name):
+        self.stack.append([name, time.time(), 0.0])
+
+    def stop(self, name):
+        started, start, inner = self.stack.pop()
+        if started != name:
+            raise ValueError("stopping timer '%s' while '%s' is running" % (name, started))
+        elapsed = time.time() - start
+        self.timers[name] = self.timers.get(name, 0.0) + elapsed - inner
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def counted(self, name, iterable):
+        """Generator that passes on the items of 'iterable', counting them in counter 'name'."""
+        counters = self.counters
+        counters.setdefault(name, 0)
+        for item in iterable:
+            counters[name] += 1
+            yield item
+
+    def timed(self, name, iterable):
+        """Generator that passes on the items of 'iterable', charging the time taken to produce them to timer 'name'."""
+        iterator = iter(iterable)
+        while True:
+            self.start(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.stop(name)
+                return
+            except:
+                self.stop(name)
+                raise
+            self.stop(name)
+            yield item
+
+    def report(self):
+        return {'seconds': time.time() - self.created,
+                'timers': self.timers,
+                'counters': self.counters}
+
+    def write(self, path):
+        fileh = open(path, 'w')
+        json.dump(self.report(), fileh, indent=1, sort_keys=True)
+        fileh.write('\n')
+        fileh.close()
+
+
+class null_profiler:
+    """Stands in for profiler when profiling is off."""
+
+    enabled = False
+
+    def start(self, name):
+        pass
+
+    def stop(self, name):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def counted(self, name, iterable):
+        return iterable
+
+    def timed(self, name, iterable):
+        return iterable
+
+null = null_profiler()
@@ -3,9 +3,14 @@
 # We grab these here before the namespace gets polluted:
 global_names = globals().keys()
 
-import tokenize, keyword, sys, os, optparse
+import tokenize, keyword, sys, os, re, time, shutil, optparse, imp, marshal, tempfile, hashlib, json, multiprocessing, __builtin__
+import string, itertools, ast, symtable
+import profiler, pyminifier, artifact, optimizer, streaming, cStringIO
 
 
+engines = ['names', 'scope']
+default_jobs = multiprocessing.cpu_count() # Worker processes for introspecting imported modules
+
 class cmdline_parse:
     """Class that holds all information necessary for parsing the commandline for
 correctness."""
@@ -42,196 +47,1213 @@ correctness."""
                                metavar='FILE',
                                help='The FILE to be used as input for the obfuscator',
                                default='')
+        self.parser.add_option('-d',
+                               '--directory',
+                               action='store',
+                               type='string',
+                               dest='input_dir',
+                               metavar='DIR',
+                               help='Obfuscate every Python file under DIR into the directory given with -o',
+                               default='')
         self.parser.add_option('-o',
                                '--output',
                                action='store',
                                type='string',
                                dest='output_file',
                                metavar='FILE',
-                               help='The FILE to write the obfuscated output to [default=stdout]',
+                               help='The FILE (or directory, with -d) to write the obfuscated output to [default=stdout]',
+                               default='')
+        self.parser.add_option('-s',
+                               '--state',
+                               action='store',
+                               type='string',
+                               dest='state_file',
+                               metavar='FILE',
+                               help='Keep the rename map in FILE between runs, and with -d only rewrite the files that need it',
+                               default='')
+        self.parser.add_option('--cache-dir',
+                               action='store',
+                               type='string',
+                               dest='cache_dir',
+                               metavar='DIR',
+                               help='Cache the names found in imported modules under DIR [default=%default]',
+                               default=default_cache_dir())
+        self.parser.add_option('--no-cache',
+                               action='store_false',
+                               dest='use_cache',
+                               help='Always import modules to find their names, ignoring the cache',
+                               default=True)
+        self.parser.add_option('--cache-stats',
+                               action='store_true',
+                               dest='cache_stats',
+                               help='Report name cache hits and misses on stderr',
+                               default=False)
+        self.parser.add_option('--prebuild-cache',
+                               action='store',
+                               type='string',
+                               dest='prebuild_file',
+                               metavar='FILE',
+                               help='Fill the name cache for the modules listed in FILE (one per line, requirements style)',
+                               default='')
+        self.parser.add_option('-j',
+                               '--jobs',
+                               action='store',
+                               type='int',
+                               dest='jobs',
+                               help='Number of worker processes used to introspect imported modules, 0 to import them in-process [default=%default]',
+                               default=default_jobs)
+        self.parser.add_option('--import-timeout',
+                               action='store',
+                               type='float',
+                               dest='import_timeout',
+                               metavar='SECONDS',
+                               help='Give up on a module that takes longer than SECONDS to introspect [default=%default]',
+                               default=30.0)
+        self.parser.add_option('--short-names',
+                               action='store_true',
+                               dest='short_names',
+                               help='Give the most used names the shortest replacements, and leave out the spaces that are not needed',
+                               default=False)
+        self.parser.add_option('--engine',
+                               action='store',
+                               type='choice',
+                               choices=engines,
+                               dest='engine',
+                               help='Rename every name that is not known from the builtins and imported modules (names), or only the names the source binds, found from its scopes without importing anything (scope) [default=%default]',
+                               default='names')
+        self.parser.add_option('--optimize-runtime',
+                               action='store_true',
+                               dest='optimize_runtime',
+                               help='Fold constant expressions and hoist the global, builtin and module attribute lookups in loops into locals before renaming (see optimizer.py)',
+                               default=False)
+        artifact.add_options(self.parser)
+        self.parser.add_option('--profile',
+                               action='store',
+                               type='string',
+                               dest='profile_file',
+                               metavar='FILE',
+                               help='Write the time spent in each stage, and counts of tokens, names and modules, to FILE as JSON',
                                default='')
 
     def __handle_exceptions(self):
-        if not self.options.input_file:
-            self.parser.error("an input file must be specified with -f")
+        if self.options.prebuild_file:
+            if not self.options.use_cache:
+                self.parser.error("--prebuild-cache cannot be combined with --no-cache")
+            if not os.access(self.options.prebuild_file, os.R_OK):
+                self.parser.error("the file '%s' specified with --prebuild-cache is not able to be read" % self.options.prebuild_file)
+        if self.options.input_dir:
+            if self.options.input_file:
+                self.parser.error("-f and -d cannot be used together")
+            if self.options.short_names:
+                self.parser.error("--short-names cannot be used with -d")
+            if self.options.engine != 'names':
+                self.parser.error("--engine %s cannot be used with -d" % self.options.engine)
+            if self.options.optimize_runtime:
+                self.parser.error("--optimize-runtime cannot be used with -d")
+            if self.options.artifact != 'py':
+                self.parser.error("--artifact cannot be used with -d (compile the output directory with artifact.py)")
+            if not os.path.isdir(self.options.input_dir):
+                self.parser.error("the directory '%s' specified with -d does not exist" % self.options.input_dir)
+            if not self.options.output_file:
+                self.parser.error("an output directory must be specified with -o when using -d")
+        elif not self.options.input_file:
+            if not self.options.prebuild_file:
+                self.parser.error("an input file must be specified with -f")
         else:
             if not os.access(self.options.input_file, os.R_OK):
                 self.parser.error("the file '%s' specified with -f is not able to be read" % self.options.input_file)
+            if self.options.artifact != 'py' and not self.options.output_file:
+                self.parser.error("an output file must be specified with -o when using --artifact")
+        artifact.check_options(self.parser, self.options)
+
+
+class name_registry:
+    """An ordered collection of names with constant-time membership tests.
+Iterating over a registry also visits names that are merged into it while the
+iteration is underway, just like iterating over a growing list would."""
+
+    def __init__(self, names=()):
+        self.names = []
+        self.index = set()
+        self.merge(names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        i = 0
+        while i < len(self.names):
+            yield self.names[i]
+            i += 1
+
+    def add(self, name):
+        if name not in self.index:
+            self.index.add(name)
+            self.names.append(name)
+
+    def merge(self, names):
+        index = self.index
+        append = self.names.append
+        for name in names:
+            if name not in index:
+                index.add(name)
+                append(name)
+
+
+class counting_registry(name_registry):
+    """A name_registry that counts its membership tests in counter 'counter' of
+the profiler 'profile'.  Used for the known names when profiling."""
+
+    def __init__(self, names=(), profile=profiler.null, counter='lookups'):
+        self.profile = profile
+        self.counter = counter
+        name_registry.__init__(self, names)
+
+    def __contains__(self, name):
+        self.profile.count(self.counter)
+        return name in self.index
+
+
+class overlay_registry(name_registry):
+    """A name_registry layered over a shared 'base' registry, which it never
+changes.  Membership tests see the names of both, while names added or merged
+go into the overlay only, so many overlays can share one base."""
+
+    def __init__(self, base, names=()):
+        self.base = base
+        name_registry.__init__(self, names)
+
+    def __contains__(self, name):
+        return name in self.index or name in self.base
+
+    def __len__(self):
+        return len(self.base) + len(self.names)
+
+    def __iter__(self):
+        for name in self.base:
+            yield name
+        for name in name_registry.__iter__(self):
+            yield name
+
+    def add(self, name):
+        if name not in self.base:
+            name_registry.add(self, name)
+
+    def merge(self, names):
+        name_registry.merge(self, [x for x in names if x not in self.base])
+
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'pyfuscate')
+
+
+def write_atomically(path, data):
+    """Replaces the file at 'path' with 'data' so that readers only ever see
+the old or the new contents."""
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, temp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    fileh = os.fdopen(fd, 'wb')
+    try:
+        fileh.write(data)
+    finally:
+        fileh.close()
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(temp_name, path)
+
+
+def introspect_module(name):
+    """Imports the module 'name' and returns the names found by walking its
+attributes two levels deep, or None if the module cannot be imported."""
+    try:
+        module = __import__(name)
+    except ImportError:
+        return None
+    for part in name.split('.')[1:]:
+        module = getattr(module, part)
+    names = name_registry()
+    dirlist = dir(module)
+    names.merge(dirlist)
+    for entry in dirlist:
+        if name+'.'+entry == 'wx.TheClipboard':
+            # One-off special case
+            continue
+        try:
+            names.merge(dir(getattr(module, entry)))
+        except AttributeError:
+            pass
+    return names.names
+
+
+def scan_imports(readline):
+    """Returns the dotted module names on the 'import' lines of the token
+stream read from 'readline', in order of first appearance."""
+    modules = name_registry()
+    line_start = True
+    import_line = False
+    dotted = []
+    for tok_type, tok_string, start, end, line in tokenize.generate_tokens(readline):
+        if tok_type in (tokenize.COMMENT, tokenize.NL, tokenize.INDENT, tokenize.DEDENT):
+            continue
+        if line_start:
+            import_line = tok_string == 'import'
+            line_start = False
+        elif import_line:
+            if tok_type == tokenize.NAME:
+                dotted.append(tok_string)
+                continue
+            if tok_string == '.' and dotted:
+                continue
+        if dotted:
+            modules.add('.'.join(dotted))
+            dotted = []
+        if tok_type == tokenize.NEWLINE:
+            line_start = True
+    return modules.names
+
+
+def introspect_worker(name, connection):
+    """Runs introspect_module() for 'name' in a child process of
+introspect_modules(), sending back its result, or the exception it raised as
+a string, through 'connection'."""
+    try:
+        connection.send((introspect_module(name), None))
+    except Exception, e:
+        connection.send((None, str(e) or e.__class__.__name__))
+    connection.close()
+
+
+def introspect_modules(names, cache=None, jobs=0, timeout=None, poll_interval=0.01):
+    """Returns a dictionary mapping each module in 'names' to the result of
+introspect_module() for it.  Cache misses are introspected concurrently in up
+to 'jobs' child processes, one fresh process per module, so that import-time
+side effects, crashes and hangs stay out of this process.  A module whose
+process fails or dies, or is not finished within 'timeout' seconds of its own
+start, maps to None.  With 'jobs' set to 0 the modules are imported here, one
+at a time."""
+    results = {}
+    pending = []
+    for name in names:
+        if cache:
+            results[name] = cache.cached(name)
+            if results[name] is not None:
+                continue
+        pending.append(name)
+    if jobs <= 0 or not pending:
+        for name in pending:
+            results[name] = introspect_module(name)
+    else:
+        waiting = pending[::-1]
+        running = [] # (name, process, connection, start time)
+        try:
+            while waiting or running:
+                while waiting and len(running) < jobs:
+                    name = waiting.pop()
+                    receiver, sender = multiprocessing.Pipe(False)
+                    process = multiprocessing.Process(target=introspect_worker, args=(name, sender))
+                    process.daemon = True
+                    process.start()
+                    sender.close()
+                    running.append((name, process, receiver, time.time()))
+                still_running = []
+                for name, process, receiver, started in running:
+                    error = None
+                    if receiver.poll() or not process.is_alive():
+                        # A process that has exited may still have sent its result
+                        try:
+                            results[name], error = receiver.recv()
+                        except EOFError:
+                            process.join()
+                            error = "exited with code %s" % process.exitcode
+                    elif timeout is not None and time.time() - started > timeout:
+                        sys.stderr.write("Introspection timed out for: %s\n" % name)
+                        process.terminate()
+                        results[name] = None
+                    else:
+                        still_running.append((name, process, receiver, started))
+                        continue
+                    if error:
+                        sys.stderr.write("Introspection failed for: %s (%s)\n" % (name, error))
+                        results[name] = None
+                    process.join()
+                    receiver.close()
+                if len(still_running) == len(running):
+                    time.sleep(poll_interval)
+                running = still_running
+        finally:
+            for name, process, receiver, started in running:
+                process.terminate()
+                process.join()
+    if cache:
+        for name in pending:
+            cache.update(name, results[name])
+    return results
+
+
+def iter_short_names():
+    """Generator of identifiers from the shortest up: a to Z, then aa, ab and so on."""
+    for length in itertools.count(1):
+        for first in string.ascii_letters:
+            for rest in itertools.product(string.ascii_letters + string.digits, repeat=length - 1):
+                yield first + ''.join(rest)
+
+
+def read_requirements(requirements):
+    """Returns the module names listed in the 'requirements' file object, one
+per line.  Version specifiers, extras and comments are ignored."""
+    names = name_registry()
+    for line in requirements:
+        names.add(re.split(r'[\s<>=!~;\[#]', line.strip(), 1)[0])
+    return [x for x in names if x]
+
+
+class name_cache:
+    """Keeps the results of introspect_module() on disk, one file per module, so
+that later runs do not have to import the module again.  An entry is only
+trusted if it was written by the same interpreter version for a module at the
+same path with the same modification time.  Modules are located with imp
+rather than imported (except a submodule of a plain module, such as os.path,
+which only exists once its parent has run), entries are read lazily on first
+use, and writes go through a temporary file that is renamed into place."""
+
+    version = 1
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.python = sys.version.split()[0]
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def module_key(self, name):
+        """Returns (path, mtime) for the module 'name' without importing it,
+or None if it cannot be located."""
+        path = None
+        search_path = None
+        for part in name.split('.'):
+            if search_path is False:
+                return self.imported_key(name)
+            try:
+                fileh, path, description = imp.find_module(part, search_path)
+            except ImportError:
+                return None
+            if fileh:
+                fileh.close()
+            if description[2] == imp.PKG_DIRECTORY:
+                search_path = [path]
+                for init in ('__init__.py', '__init__.pyc', '__init__.pyo'):
+                    if os.path.exists(os.path.join(path, init)):
+                        path = os.path.join(path, init)
+                        break
+            else:
+                search_path = False
+        if not os.path.isfile(path):
+            # Builtin and frozen modules change along with the interpreter
+            path = sys.executable
+        try:
+            return (os.path.abspath(path), os.stat(path).st_mtime)
+        except OSError:
+            return None
+
+    def imported_key(self, name):
+        """Returns (path, mtime) for the module 'name' from the __file__ it has
+once imported, or None if it cannot be imported.  This is for the submodules
+that a plain module puts in sys.modules as it runs, which imp cannot find."""
+        try:
+            __import__(name)
+            path = getattr(sys.modules[name], '__file__', None) or sys.executable
+        except Exception:
+            return None
+        if path[-4:] in ('.pyc', '.pyo') and os.path.isfile(path[:-1]):
+            path = path[:-1] # A stale .pyc keeps its mtime when only the source changes
+        try:
+            return (os.path.abspath(path), os.stat(path).st_mtime)
+        except OSError:
+            return None
+
+    def entry_file(self, name):
+        return os.path.join(self.directory, '%s-%s.names' % (name, self.python))
+
+    def load(self, name):
+        if name not in self.entries:
+            try:
+                fileh = open(self.entry_file(name), 'rb')
+                try:
+                    self.entries[name] = marshal.load(fileh)
+                finally:
+                    fileh.close()
+            except (IOError, EOFError, ValueError, TypeError):
+                self.entries[name] = None
+        return self.entries[name]
+
+    def store(self, name, entry):
+        self.entries[name] = entry
+        try:
+            write_atomically(self.entry_file(name), marshal.dumps(entry))
+        except (IOError, OSError):
+            # The cache is only an optimisation, so carry on without it
+            pass
+
+    def cached(self, name):
+        """Returns the cached names for the module 'name', or None if the
+cache has no valid entry for it."""
+        key = self.module_key(name)
+        if key is not None:
+            entry = self.load(name)
+            if entry and tuple(entry[:4]) == (self.version, self.python) + key:
+                self.hits += 1
+                return entry[4]
+        self.misses += 1
+        return None
+
+    def update(self, name, names):
+        key = self.module_key(name)
+        if names is not None and key is not None:
+            self.store(name, (self.version, self.python) + key + (names,))
+
+    def lookup(self, name):
+        """Returns the names for the module 'name' (see introspect_module),
+importing the module only if the cache has no valid entry for it."""
+        names = self.cached(name)
+        if names is None:
+            names = introspect_module(name)
+            self.update(name, names)
+        return names
+
+    def prebuild(self, requirements, jobs=0, timeout=None):
+        """Fills the cache for every module listed in the 'requirements' file
+object (see read_requirements)."""
+        names = read_requirements(requirements)
+        results = introspect_modules(names, self, jobs, timeout)
+        for name in names:
+            if results[name] is None:
+                sys.stderr.write("Import error for: %s\n" % name)
 
 
 class pyfuscate:
     """This is the class that actually takes the pristine Python sourcecode and
 spits back out the obfuscated result.  Execution flow begins when self.run()
-is called, which in turn calls tokenize.tokenize() with one of its own
-functions (self.token_collector) specified as the output for the token stream.
-Once a full line of tokens has been collected, self.token_collector calls
-self.obfu(), which processes that line and prints it before clearing the token
-list and returning."""
-
-    def __init__(self, known_names=globals().keys()):
-        self.indent_list = ['',]
-        self.token_line = []
+is called, which writes out the chunks produced by self.iter_chunks().  That is
+a pipeline of generators over the stream from tokenize.generate_tokens():
+self.rename_tokens() replaces the names, self.format_tokens() turns the tokens
+back into text, and the text is gathered into chunks for writing.  Only the
+current dotted name is held in memory, never a whole line or file."""
+
+    def __init__(self, known_names=globals().keys(), walk_names=True, profile=profiler.null):
+        self.profile = profile
         self.name_dict = {}
-        self.obfu_names = []
+        self.obfu_names = name_registry()
         self.counter = 0
+        self.cache = None
+        self.jobs = 0
+        self.import_timeout = None
+        self.introspected = {}
+        self.keep_from_imports = False
+        self.short_names = False
+        self.short_map = None
         self.file_in = None
         self.file_out = sys.stdout
-        self.known_names = known_names #Hopefully we are supplied a clean list
-        self.known_names += [x for x in dir(__builtins__) if x not in self.known_names]
-        self.known_names += [x for x in dir({}) if x not in self.known_names]
-        self.known_names += [x for x in dir([]) if x not in self.known_names]
-        self.known_names += [x for x in dir('') if x not in self.known_names]
-        self.known_names += [x for x in dir(('',)) if x not in self.known_names]
-        self.known_names += keyword.kwlist
+        self.known_names = self.known_registry(known_names) #Hopefully we are supplied a clean list
+        if not walk_names:
+            return
+        profile.start('walk_names')
+        self.known_names.merge(dir(__builtin__)) # Not __builtins__, which is only the module when run as a script
+        self.known_names.merge(dir({}))
+        self.known_names.merge(dir([]))
+        self.known_names.merge(dir(''))
+        self.known_names.merge(dir(('',)))
+        self.known_names.merge(keyword.kwlist)
         for i in self.known_names:
             try:
                 x = dir(eval(i))
-                self.known_names += [y for y in x if y not in self.known_names]
+                self.known_names.merge(x)
                 for z in x:
                     try:
-                        a = dir(eval(z))
-                        self.known_names += [p for p in a if p not in self.known_names]
+                        self.known_names.merge(dir(eval(z)))
                     except NameError:
                         pass
             except (NameError, SyntaxError):
                 pass
+        profile.stop('walk_names')
+
+    def known_registry(self, names):
+        """Returns a registry of the known 'names', counting lookups in it when profiling."""
+        if self.profile.enabled:
+            return counting_registry(names, self.profile, 'known-name lookups')
+        return name_registry(names)
 
     def run(self):
-        self.file_out.write('#!/usr/bin/python\n')
-        tokenize.tokenize(self.file_in.readline, self.token_collector)
-   
-    def token_collector(self, tok_type, tok_string, tok_tuple_scoord, tok_tuple_ecoord, tok_lineno):
-        if tok_type == tokenize.COMMENT:
-            return
-        elif tok_type == tokenize.NL:
-            return
-        elif tok_type == tokenize.INDENT:
-            self.indent_list.append(tok_string)
-            return
-        elif tok_type == tokenize.DEDENT:
-            self.indent_list.pop()
-            return
-        elif tok_type == tokenize.NEWLINE:
-            self.obfu()
-        else:
-            self.token_line.append((tok_type, tok_string, tok_tuple_scoord, tok_tuple_ecoord, tok_lineno))
-    
-    def obfu(self):
-        """This function does the bulk of the work in the class.  It operates on
-self.token_line and prints out the obfuscated result before returning."""
+        self.prefetch_imports()
+        if self.short_names:
+            self.plan_short_names(self.file_in.readline)
+            self.file_in.seek(0)
+        for chunk in self.iter_chunks(self.file_in.readline):
+            self.file_out.write(chunk)
+
+    def iter_chunks(self, readline, chunk_size=65536):
+        """Generator that obfuscates the source read from 'readline' in a single
+pass over its tokens, yielding the output in chunks of about 'chunk_size'
+characters."""
+        buffered = ['#!/usr/bin/python\n']
+        size = 0
+        profile = self.profile
+        tokens = profile.counted('tokens', profile.timed('tokenize', tokenize.generate_tokens(readline)))
+        tokens = profile.timed('rename_tokens', self.rename_tokens(tokens))
+        for piece in profile.timed('format_tokens', self.layout_tokens(tokens)):
+            buffered.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield ''.join(buffered)
+                buffered = []
+                size = 0
+        if buffered:
+            yield ''.join(buffered)
+
+    def rename_tokens(self, tokens):
+        """Generator that does the bulk of the work in the class.  It renames the
+user-assigned names in the token stream 'tokens' and yields (type, string)
+pairs.  A dotted name such as 'self.foo.bar' is gathered as the tokens go by
+and comes out as a single NAME token.  Names are interned as they are
+gathered, so the registries and the rename map all share one copy of each.
+Comments, blank lines and 'from' import lines are dropped, unless
+self.keep_from_imports is set: then the module part of a 'from' line is kept
+as it is and the imported names are renamed like any others."""
+        line_start = True
         import_line = False
-        bracket_stack = []
-        obfu_line = ''
-        if self.token_line[0][1] == 'import':
-            import_line = True
-        elif self.token_line[0][1] == 'from':
-            return
-        pop_list = self.token_line[:]
-        pop_list.reverse()
-        while pop_list:
-            curr_item = pop_list.pop()
-            tok_type = curr_item[0]
-            tok_string = curr_item[1]
+        from_line = False
+        from_module = False
+        dotted = []
+        want_name = False
+        for token in tokens:
+            tok_type, tok_string = token[0], token[1]
+            if tok_type == tokenize.COMMENT or tok_type == tokenize.NL:
+                continue
+            if from_line:
+                if tok_type == tokenize.NEWLINE:
+                    from_line = False
+                    line_start = True
+                continue
+            if line_start and tok_type != tokenize.INDENT and tok_type != tokenize.DEDENT:
+                line_start = False
+                import_line = tok_string == 'import'
+                if tok_string == 'from':
+                    if not self.keep_from_imports:
+                        from_line = True
+                        continue
+                    from_module = True
+            if from_module:
+                from_module = tok_string != 'import'
+                yield tok_type, tok_string
+                continue
+            if dotted:
+                if want_name and tok_type == tokenize.NAME:
+                    dotted.append(intern(tok_string))
+                    want_name = False
+                    continue
+                if not want_name and tok_string == '.' and tok_type == tokenize.OP:
+                    want_name = True
+                    continue
+                yield tokenize.NAME, self.rename_dotted(dotted, import_line)
+                if want_name:
+                    yield tokenize.OP, '.'
+                dotted = []
+                want_name = False
             if tok_type == tokenize.NAME:
-                total_name_list, name_count = self.get_full_name(self.token_line[len(self.token_line)-len(pop_list)-1:])
-                [pop_list.pop() for i in range(name_count-1)]
-                prepped_names = []
-                if import_line:
-                    if len(total_name_list) > 1:
-                        name = '.'.join(total_name_list)
-                    else:
-                        name = total_name_list[0]
-                    if name not in self.known_names:
-                        self.known_names.append(name)
-                        try:
-                            exec('import '+name)
-                            try:
-                                dirlist = dir(eval(name))
-                                self.known_names += [y for y in dirlist if y not in self.known_names]
-                                for entry in dirlist:
-                                    if name+'.'+entry == 'wx.TheClipboard':
-                                        # One-off special case
-                                        continue
-                                    try:
-                                        entrylist = dir(eval(name+'.'+entry))
-                                        self.known_names += [y for y in entrylist if y not in self.known_names]
-                                    except NameError:
-                                        pass
-                            except NameError:
-                                pass
-                        except ImportError:
-                            sys.stderr.write("Import error for: %s\n" % tok_string)
-                    tok_string = name+' '
+                dotted.append(intern(tok_string))
+                continue
+            if tok_type == tokenize.NEWLINE:
+                line_start = True
+            yield tok_type, tok_string
+
+    def rename_dotted(self, total_name_list, import_line):
+        """Returns the replacement for the dotted name made up of the names in
+'total_name_list'.  On an 'import' line the module is introspected instead
+and its name is left as it is."""
+        if import_line:
+            name = '.'.join(total_name_list)
+            if name not in self.known_names:
+                self.known_names.add(name)
+                names = self.introspect(name)
+                if names is None:
+                    sys.stderr.write("Import error for: %s\n" % total_name_list[0])
                 else:
-                    known_name = False
-                    for name in total_name_list:
-                        if name == 'self':
-                            known_name = False
-                        if known_name:
-                            if name not in self.known_names:
-                                self.known_names.append(name)
-                        elif name in self.known_names:
-                            known_name = True
-                        elif name in self.obfu_names:
-                            name = self.name_dict[name]
-                        else:
-                            if name[:2] == '__':
-                                self.name_dict[name] = '__name'+hex(self.counter)
-                            elif name[:1] == '_':
-                                self.name_dict[name] = '_name'+hex(self.counter)
-                            else:
-                                self.name_dict[name] = 'name'+hex(self.counter)
-                            self.obfu_names.append(name)
-                            self.counter += 1
-                            name = self.name_dict[name]
-                        prepped_names.append(name)
-                    tok_string = '.'.join(prepped_names)+' '
-            elif tok_type == tokenize.OP:
-                if tok_string == '(':
-                    bracket_stack.append(tok_string)
-                    tok_string += ' '
-                elif tok_string == ')':
-                    bracket_stack.pop()
-                    tok_string += ' '
-                tok_string += ' ' 
+                    self.known_names.merge(names)
+            return name
+        prepped_names = []
+        known_name = False
+        for name in total_name_list:
+            if name == 'self':
+                known_name = False
+            if known_name:
+                self.known_names.add(name)
+            elif name in self.known_names:
+                known_name = True
             else:
-                tok_string += ' '
-            obfu_line += tok_string
-        self.file_out.write(self.indent_list[-1] + obfu_line + '\n')
-        self.token_line = []
-        
-    def get_full_name(self, token_list):
-        ret_names = []
-        count = 0
-        next = tokenize.NAME
-        for item in token_list:
-            if item[0] == next:
-                if item[0] == tokenize.NAME:
-                    ret_names.append(item[1])
-                    next = tokenize.OP
-                    count += 1
-                elif item[0] == tokenize.OP:
-                    if item[1] == '.':
-                        next = tokenize.NAME
-                        count += 1
-                    else:
-                        break
+                name = self.replacement(name)
+            prepped_names.append(name)
+        return '.'.join(prepped_names)
+
+    def replacement(self, name):
+        """Returns the replacement for the user-assigned 'name', adding it to the
+rename map the first time it is seen."""
+        if name not in self.obfu_names:
+            self.name_dict[name] = self.new_name(name)
+            self.obfu_names.add(name)
+            self.profile.count('names renamed')
+            self.counter += 1
+        return self.name_dict[name]
+
+    def new_name(self, name):
+        """Returns the replacement for 'name', a user-assigned name that has not
+been seen before."""
+        if self.short_map is not None:
+            return self.short_map[name]
+        if name[:2] == '__':
+            return '__name'+hex(self.counter)
+        elif name[:1] == '_':
+            return '_name'+hex(self.counter)
+        return 'name'+hex(self.counter)
+
+    def plan_short_names(self, readline):
+        """Renames the source read from 'readline' once without writing it out,
+counting how often each new name is used, and then gives the most used names
+the shortest replacements that are not known names or keywords, keeping the
+'_' and '__' prefixes.  Everything is then put back as it was, so the real
+pass makes the same decisions and only the replacements differ.  Names
+already in the rename map (from a state file) keep their replacements."""
+        saved = (self.known_names.names[:], self.name_dict.copy(), self.obfu_names.names[:],
+                 self.counter, self.introspected.copy())
+        first_new = len(self.obfu_names)
+        self.short_map = None
+        used = {}
+        for tok_type, tok_string in self.rename_tokens(tokenize.generate_tokens(readline)):
+            if tok_type == tokenize.NAME:
+                for part in tok_string.split('.'):
+                    used[part] = used.get(part, 0) + 1
+        new_names = self.obfu_names.names[first_new:]
+        known_names = self.known_names
+        known_names.merge(saved[1].values())
+        # Most used first, and in order of appearance among equals
+        ranked = sorted(range(len(new_names)), key=lambda i: (-used.get(self.name_dict[new_names[i]], 0), i))
+        self.short_map = {}
+        candidates = {}
+        for i in ranked:
+            name = new_names[i]
+            prefix = name[:2] == '__' and '__' or name[:1] == '_' and '_' or ''
+            if prefix not in candidates:
+                candidates[prefix] = iter_short_names()
+            short_name = prefix + next(candidates[prefix])
+            while short_name in known_names or keyword.iskeyword(short_name):
+                short_name = prefix + next(candidates[prefix])
+            self.short_map[name] = short_name
+        self.known_names = self.known_registry(saved[0])
+        self.name_dict = saved[1]
+        self.obfu_names = name_registry(saved[2])
+        self.counter = saved[3]
+        self.introspected = saved[4]
+
+    def layout_tokens(self, tokens):
+        """Lays out the (type, string) pairs from rename_tokens() as source text,
+with format_tokens(), or as compactly as pyminifier would with short names."""
+        if self.short_names:
+            return pyminifier.untokenize_minimal(tokens)
+        return self.format_tokens(tokens)
+
+    def format_tokens(self, tokens):
+        """Generator that lays out the (type, string) pairs from rename_tokens()
+as source text, one logical line per output line."""
+        indent_list = ['',]
+        line_start = True
+        for tok_type, tok_string in tokens:
+            if tok_type == tokenize.INDENT:
+                indent_list.append(tok_string)
+            elif tok_type == tokenize.DEDENT:
+                indent_list.pop()
+            elif tok_type == tokenize.NEWLINE:
+                yield '\n'
+                line_start = True
+            elif tok_type == tokenize.ENDMARKER:
+                if not line_start:
+                    yield '\n'
+            else:
+                if line_start:
+                    yield indent_list[-1]
+                    line_start = False
+                if tok_type == tokenize.OP and (tok_string == '(' or tok_string == ')'):
+                    yield tok_string + '  '
+                else:
+                    yield tok_string + ' '
+
+    def load_state(self, path):
+        """Loads the rename map saved by save_state() in a previous run, so that
+names seen before keep their replacements and new names are numbered after
+them.  Returns the per-file records that were saved along with it."""
+        try:
+            fileh = open(path, 'r')
+            try:
+                state = json.load(fileh)
+            finally:
+                fileh.close()
+        except (IOError, ValueError):
+            return {}
+        if state.get('version') != 1:
+            return {}
+        for name, new_name in state['name_dict'].items():
+            self.name_dict[str(name)] = str(new_name)
+        self.obfu_names.merge([str(x) for x in state['obfu_names']])
+        self.counter = max(self.counter, state['counter'])
+        return state['files']
+
+    def save_state(self, path, files={}):
+        state = {'version': 1,
+                 'name_dict': self.name_dict,
+                 'obfu_names': self.obfu_names.names,
+                 'counter': self.counter,
+                 'files': files}
+        write_atomically(path, json.dumps(state, sort_keys=True))
+
+    def run_tree(self, src_dir, dst_dir, state_file=None):
+        """Obfuscates every Python file under 'src_dir' into the mirrored tree
+'dst_dir', copying the other files across.  Phase one scans the files in a
+process pool and replays the dotted names they contain, file by file, through
+rename_dotted() so that one rename map covers the whole project.  Phase two
+rewrites the files independently in a second pool that shares that map, so
+names still line up across modules without having to combine them first.
+'from' imports are kept, since each module stays a separate file.
+
+With a 'state_file' the run is incremental.  The rename map and a record of
+each file (content hash, imports, top-level names, dependencies and which of
+its names were renamed) are kept in it, and only the files that changed, the
+files importing from a module whose top-level names changed, and the files
+whose names would now be treated differently are scanned or rewritten."""
+        self.keep_from_imports = True
+        order = []
+        paths = {}
+        local_modules = set()
+        for dirpath, dirnames, filenames in os.walk(src_dir):
+            dirnames.sort()
+            local_modules.update(dirnames)
+            out_dir = os.path.join(dst_dir, os.path.relpath(dirpath, src_dir))
+            if not os.path.isdir(out_dir):
+                os.makedirs(out_dir)
+            for filename in sorted(filenames):
+                if filename.endswith('.py'):
+                    local_modules.add(filename[:-3])
+                    rel = os.path.relpath(os.path.join(dirpath, filename), src_dir)
+                    order.append(rel)
+                    paths[rel] = (os.path.join(dirpath, filename), os.path.join(out_dir, filename))
+                elif not filename.endswith(('.pyc', '.pyo')):
+                    shutil.copy2(os.path.join(dirpath, filename), os.path.join(out_dir, filename))
+        # The project's own module names must survive, both on 'import' lines
+        # and as the names imported by 'from package import module'
+        self.known_names.merge(sorted(local_modules))
+
+        old_files = {}
+        if state_file:
+            old_files = self.load_state(state_file)
+        for rel in old_files:
+            if rel not in paths and os.path.exists(os.path.join(dst_dir, rel)):
+                os.remove(os.path.join(dst_dir, rel))
+        hashes = dict((rel, file_hash(paths[rel][0])) for rel in order)
+        to_scan = [rel for rel in order if rel not in old_files or old_files[rel]['hash'] != hashes[rel]]
+        base_names = self.known_names.names[:]
+        base_dict = self.name_dict.copy()
+        base_obfu_names = self.obfu_names.names[:]
+        base_counter = self.counter
+
+        # Phase one: build the global rename map
+        self.profile.start('scan')
+        pool = None
+        if self.jobs > 0 and len(order) > 1:
+            pool = multiprocessing.Pool(min(self.jobs, len(order)))
+        scanned = {}
+        try:
+            while True:
+                new = [rel for rel in to_scan if rel not in scanned]
+                if pool and len(new) > 1:
+                    results = pool.map(scan_file, [paths[rel][0] for rel in new], 8)
+                    # Unpickling gives each file its own copies of the names;
+                    # replace the results one by one to free them as we go
+                    for i in range(len(results)):
+                        results[i] = intern_scan(results[i])
                 else:
+                    results = [scan_file(paths[rel][0]) for rel in new]
+                scanned.update(zip(new, results))
+                self.known_names = self.known_registry(base_names)
+                self.name_dict = base_dict.copy()
+                self.obfu_names = name_registry(base_obfu_names)
+                self.counter = base_counter
+                files = self.build_rename_map(order, scanned, hashes, old_files, local_modules)
+                # Files that were not scanned were written against the old map;
+                # any of their names that would now be treated differently
+                # means they have to go through phase one again.
+                stale = [rel for rel in order if rel not in scanned and self.names_changed(files[rel])]
+                if not stale:
                     break
+                to_scan += stale
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+            self.profile.stop('scan')
+
+        changed_modules = set(rel for rel in scanned
+                              if rel not in old_files or old_files[rel]['exports'] != files[rel]['exports'])
+        changed_modules.update(rel for rel in old_files if rel not in paths)
+        to_rewrite = [rel for rel in order if rel in scanned
+                      or changed_modules.intersection(files[rel]['deps'])
+                      or not os.path.exists(paths[rel][1])]
+
+        # Phase two: rewrite the files against the shared map
+        self.profile.start('rewrite')
+        state = (self.known_names.names, self.name_dict, self.obfu_names.names, self.counter)
+        if self.jobs > 0 and len(to_rewrite) > 1:
+            pool = multiprocessing.Pool(min(self.jobs, len(to_rewrite)), init_rewrite_worker, (state,))
+            try:
+                pool.map(rewrite_file, [paths[rel] for rel in to_rewrite], 8)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            init_rewrite_worker(state)
+            for rel in to_rewrite:
+                rewrite_file(paths[rel])
+        self.profile.stop('rewrite')
+        self.profile.count('files rewritten', len(to_rewrite))
+        if state_file:
+            self.save_state(state_file, files)
+        sys.stderr.write("%d of %d files rewritten\n" % (len(to_rewrite), len(order)))
+
+    def build_rename_map(self, order, scanned, hashes, old_files, local_modules):
+        """Replays the dotted names of the 'scanned' files (see scan_file)
+through rename_dotted(), after the imports of every file and the names the
+unchanged files made known.  Returns the per-file records for the state."""
+        files = {}
+        imports = name_registry()
+        for rel in order:
+            if rel in scanned:
+                events, exports, from_modules = scanned[rel]
+                files[rel] = {'hash': hashes[rel], 'exports': exports}
+                files[rel]['imports'] = ['.'.join(names) for import_line, names in events
+                                         if import_line and not keyword.iskeyword(names[0])]
+                files[rel]['deps'] = [x for x in [resolve_module(rel, x, hashes) for x in from_modules] if x]
             else:
-                break
-        return ret_names, count
-    
+                files[rel] = old_files[rel]
+            for name in files[rel]['imports']:
+                if name.split('.')[0] in local_modules:
+                    self.known_names.add(name)
+                    dep = resolve_module(rel, name, hashes)
+                    if dep and dep not in files[rel]['deps'] and rel in scanned:
+                        files[rel]['deps'].append(dep)
+                else:
+                    imports.add(name)
+        self.introspected = introspect_modules([x for x in imports if x not in self.known_names],
+                                               self.cache, self.jobs, self.import_timeout)
+        for name in imports:
+            self.rename_dotted(name.split('.'), True)
+        for rel in order:
+            if rel not in scanned:
+                self.known_names.merge(files[rel]['extra'])
+        for rel in order:
+            if rel in scanned:
+                before = len(self.known_names)
+                names = name_registry()
+                for import_line, dotted in scanned[rel][0]:
+                    if not import_line:
+                        self.rename_dotted(dotted, False)
+                        names.merge(dotted)
+                files[rel]['extra'] = self.known_names.names[before:]
+                files[rel]['kept'] = [x for x in names if x in self.known_names]
+                files[rel]['renamed'] = [x for x in names if x not in self.known_names]
+        return files
+
+    def names_changed(self, record):
+        for name in record['kept']:
+            if name not in self.known_names:
+                return True
+        for name in record['renamed']:
+            if name in self.known_names or name not in self.obfu_names:
+                return True
+        return False
+
+    def prefetch_imports(self):
+        """Introspects every module imported by self.file_in up front, so that
+the modules are resolved concurrently rather than as obfu() reaches them."""
+        self.profile.start('prefetch_imports')
+        names = [x for x in scan_imports(self.file_in.readline) if x not in self.known_names]
+        self.file_in.seek(0)
+        self.introspected = introspect_modules(names, self.cache, self.jobs, self.import_timeout)
+        self.profile.count('modules introspected', len(names))
+        self.profile.stop('prefetch_imports')
+
+    def introspect(self, name):
+        if name in self.introspected:
+            return self.introspected.pop(name)
+        self.profile.count('modules introspected')
+        self.profile.start('introspect')
+        try:
+            if self.cache:
+                return self.cache.lookup(name)
+            return introspect_module(name)
+        finally:
+            self.profile.stop('introspect')
+
+
+class name_scanner(pyfuscate):
+    """Stands in for pyfuscate during the first phase of pyfuscate.run_tree().
+It walks a file's tokens exactly like pyfuscate does, but only records each
+dotted name (as an (import_line, names) pair) the first time it is seen
+instead of renaming it.  It also notes the names the file defines at the top
+level and the modules named on its 'from' lines."""
+
+    def __init__(self):
+        self.keep_from_imports = True
+        self.events = name_registry()
+        self.exports = name_registry()
+        self.from_modules = name_registry()
+
+    def rename_dotted(self, total_name_list, import_line):
+        self.events.add((import_line, tuple(total_name_list)))
+        return '.'.join(total_name_list)
+
+    def watch_tokens(self, tokens):
+        depth = 0
+        line = []
+        for token in tokens:
+            tok_type = token[0]
+            if tok_type == tokenize.INDENT:
+                depth += 1
+            elif tok_type == tokenize.DEDENT:
+                depth -= 1
+            elif tok_type == tokenize.NEWLINE:
+                if line[0] == 'from':
+                    self.from_modules.add(''.join(line[1:-1]))
+                elif depth == 0 and len(line) == 2:
+                    if line[0] in ('def', 'class') or line[1] == '=':
+                        self.exports.add(intern(line[1 - (line[1] == '=')]))
+                line = []
+            elif tok_type != tokenize.COMMENT and tok_type != tokenize.NL:
+                # Only the start of each line is needed
+                if len(line) < 2 or (line[0] == 'from' and line[-1] != 'import'):
+                    line.append(token[1])
+            yield token
+
+
+def scan_file(path):
+    """Returns the dotted names, top-level names and 'from' modules of the
+file at 'path', as recorded by name_scanner."""
+    scanner = name_scanner()
+    fileh = streaming.source_file(path)
+    try:
+        for token in scanner.rename_tokens(scanner.watch_tokens(tokenize.generate_tokens(fileh.readline))):
+            pass
+    finally:
+        fileh.close()
+    return scanner.events.names, scanner.exports.names, scanner.from_modules.names
+
+
+def scope_names(source, filename='<string>'):
+    """Returns the names that 'source' binds in its module and function scopes,
+and the names that must be left as they are wherever they appear: parameters
+(as they can be passed by keyword), keyword arguments, attributes, names bound
+in class bodies (which are read as attributes), imported names and the names
+they are imported as from other modules, names used
+without being bound in the file (builtins and the like) and dunder names.  The
+names bound in a scope that calls locals(), vars(), eval() or exec, or at the
+module level when globals() is used, are kept as well."""
+    table = symtable.symtable(source, filename, 'exec')
+    module_names = set(x.get_name() for x in table.get_symbols() if x.is_assigned())
+    bound = set()
+    kept = set()
+    dynamic_globals = False
+    tables = [table]
+    while tables:
+        table = tables.pop()
+        tables.extend(table.get_children())
+        symbols = table.get_symbols()
+        names = set(x.get_name() for x in symbols)
+        dynamic = bool(names.intersection(['locals', 'vars', 'eval'])) or \
+                  (hasattr(table, 'has_exec') and table.has_exec())
+        dynamic_globals = dynamic_globals or 'globals' in names
+        for symbol in symbols:
+            name = symbol.get_name()
+            if symbol.is_parameter() or symbol.is_imported():
+                kept.add(name)
+            elif symbol.is_global() and name not in module_names:
+                kept.add(name)
+            elif symbol.is_assigned():
+                if table.get_type() == 'class' or dynamic:
+                    kept.add(name)
+                else:
+                    bound.add(name)
+    if dynamic_globals:
+        kept.update(module_names)
+    for node in ast.walk(compile(source, filename, 'exec', ast.PyCF_ONLY_AST)):
+        if isinstance(node, ast.Attribute):
+            kept.add(node.attr)
+        elif isinstance(node, ast.keyword) and node.arg:
+            kept.add(node.arg)
+        elif isinstance(node, ast.ImportFrom):
+            kept.update(x.name for x in node.names)
+    kept.update(x for x in bound if x[:2] == '__' and x[-2:] == '__')
+    return bound, kept
+
+
+class scope_pyfuscate(pyfuscate):
+    """A pyfuscate that decides which names to rename from the source itself
+rather than from the known names.  The symtable and ast modules show which
+names the source binds, and only those are renamed, unless scope_names()
+finds a use that means they must be kept.  There is no walk over the
+builtins and no module is imported.  Each source is analysed once, before
+it is renamed; the names of every source given are put together, so that
+several files can share one rename map."""
+
+    def __init__(self, profile=profiler.null):
+        pyfuscate.__init__(self, dir(__builtin__) + keyword.kwlist, walk_names=False, profile=profile)
+        self.bound = set()
+
+    def add_source(self, source, filename='<string>'):
+        """Analyses the scopes of 'source' for the names to rename."""
+        self.profile.start('scope_names')
+        bound, kept = scope_names(source, filename)
+        self.bound.update(bound)
+        # Short names must not clash with the names that are kept
+        self.known_names.merge(sorted(kept))
+        self.profile.stop('scope_names')
+
+    def prefetch_imports(self):
+        self.add_source(self.file_in.read(), getattr(self.file_in, 'name', '<string>'))
+        self.file_in.seek(0)
+
+    def rename_dotted(self, total_name_list, import_line):
+        if import_line:
+            return '.'.join(total_name_list)
+        prepped_names = []
+        for name in total_name_list:
+            if name in self.bound and name not in self.known_names:
+                name = self.replacement(name)
+            prepped_names.append(name)
+        return '.'.join(prepped_names)
+
+
+def intern_scan(result):
+    """Interns the names in a result from scan_file(), so that a name found in
+many files is held once."""
+    events, exports, from_modules = result
+    events = [(import_line, tuple([intern(x) for x in names])) for import_line, names in events]
+    return events, [intern(x) for x in exports], from_modules
+
+
+def file_hash(path):
+    fileh = open(path, 'rb')
+    try:
+        return hashlib.sha1(fileh.read()).hexdigest()
+    finally:
+        fileh.close()
+
+
+def resolve_module(rel, module, project_files):
+    """Returns the file in 'project_files' (paths relative to the project
+root) that holds the module 'module' as imported from the file 'rel', or
+None if the module is not part of the project."""
+    name = module.lstrip('.')
+    level = len(module) - len(name)
+    bases = [os.path.dirname(rel)]
+    if level:
+        for i in range(level - 1):
+            bases[0] = os.path.dirname(bases[0])
+    else:
+        # Absolute, or an implicit relative import
+        bases.insert(0, '')
+    for base in bases:
+        path = os.path.join(base, *name.split('.')) if name else base
+        for candidate in (path + '.py', os.path.join(path, '__init__.py')):
+            if candidate in project_files:
+                return candidate
+    return None
+
+
+# The pyfuscate instance used by rewrite_file() in each worker process
+rewrite_worker = None
+
+def init_rewrite_worker(state):
+    global rewrite_worker
+    known_names, name_dict, obfu_names, counter = state
+    rewrite_worker = pyfuscate(known_names, walk_names=False)
+    rewrite_worker.name_dict = name_dict
+    rewrite_worker.obfu_names = name_registry(obfu_names)
+    rewrite_worker.counter = counter
+    rewrite_worker.keep_from_imports = True
+
+def rewrite_file(paths):
+    src_path, dst_path = paths
+    file_in = streaming.source_file(src_path)
+    file_out = open(dst_path, 'w')
+    try:
+        for chunk in rewrite_worker.iter_chunks(file_in.readline):
+            file_out.write(chunk)
+    finally:
+        file_in.close()
+        file_out.close()
+
 
 if __name__ == "__main__":
     prs = cmdline_parse("0.1")
     prs.parse()
-    obfu = pyfuscate(global_names)
-    obfu.file_in = open(prs.options.input_file, 'r')
-    if prs.options.output_file:
-        obfu.file_out = open(prs.options.output_file, 'w')
-    obfu.counter = prs.options.count_index
-    if prs.options.preserve_names:
-        obfu.known_names += prs.options.preserve_names.split()
-    obfu.run()
-
+    profile = profiler.null
+    if prs.options.profile_file:
+        profile = profiler.profiler()
+    cache = None
+    if prs.options.use_cache:
+        cache = name_cache(prs.options.cache_dir)
+    if prs.options.prebuild_file:
+        cache.prebuild(open(prs.options.prebuild_file, 'r'), prs.options.jobs, prs.options.import_timeout)
+    if prs.options.input_file or prs.options.input_dir:
+        if prs.options.engine == 'scope':
+            obfu = scope_pyfuscate(profile=profile)
+        else:
+            obfu = pyfuscate(global_names, profile=profile)
+        obfu.cache = cache
+        obfu.jobs = prs.options.jobs
+        obfu.import_timeout = prs.options.import_timeout
+        obfu.counter = prs.options.count_index
+        obfu.short_names = prs.options.short_names
+        if prs.options.preserve_names:
+            obfu.known_names.merge(prs.options.preserve_names.split())
+        if prs.options.input_dir:
+            obfu.run_tree(prs.options.input_dir, prs.options.output_file, prs.options.state_file)
+        else:
+            if prs.options.state_file:
+                obfu.load_state(prs.options.state_file)
+            obfu.file_in = streaming.source_file(prs.options.input_file)
+            if prs.options.optimize_runtime:
+                profile.start('optimize')
+                obfu.file_in = cStringIO.StringIO(optimizer.optimize(obfu.file_in.read()))
+                profile.stop('optimize')
+            if prs.options.artifact != 'py':
+                obfu.file_out = cStringIO.StringIO()
+            elif prs.options.output_file:
+                obfu.file_out = open(prs.options.output_file, 'w')
+            obfu.run()
+            if prs.options.artifact != 'py':
+                output = obfu.file_out.getvalue()
+                artifact.write_artifact(prs.options.artifact, prs.options.output_file, output, prs.options.optimize,
+                                        prs.options.compression, prs.options.compress_level)
+                if prs.options.artifact == 'packed':
+                    artifact.report_sizes(prs.options.output_file, os.path.getsize(prs.options.input_file), len(output),
+                                          'obfuscated')
+            if prs.options.state_file:
+                obfu.save_state(prs.options.state_file)
+    if prs.options.cache_stats and cache:
+        sys.stderr.write("name cache: %d hits, %d misses\n" % (cache.hits, cache.misses))
+    if prs.options.profile_file:
+        if cache:
+            profile.count('name cache hits', cache.hits)
+            profile.count('name cache misses', cache.misses)
+        profile.write(prs.options.profile_file)
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+
+"""
+pyfuscate server:  Keeps pyfuscate's known-name state warm between requests.
+
+Every pyfuscate.py run walks the builtins to find the known names and imports
+the modules its input uses.  This server does the walk once at startup, keeps
+the names found in every module it has introspected, and then obfuscates (or
+minifies) source sent to it for as long as it runs.
+
+Requests and responses are JSON objects, one per line.  They are read from a
+Unix socket given with --socket, where each connection is served in its own
+thread and may send any number of requests, or else from stdin, with the
+responses written to stdout.  A request looks like
+
+    {"id": 1, "action": "obfuscate", "source": "...", "preserve": ["name"], "count": 0}
+
+where only "source" is required; "action" may also be "minify".  The response
+is {"id": 1, "output": "..."} or {"id": 1, "error": "..."}.
+
+Each request gets its own rename map, and the names it learns from its imports
+go into an overlay of its own, so requests never see each other's names.  The
+names found in a module are kept per module, so a module is only introspected
+once, and they are merged into a request's overlay when it imports it.
+"""
+
+import sys, os, json, optparse, threading, SocketServer
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+import pyfuscate, pyminifier
+
+class warm_state:
+    """The state shared by all requests: the known names found by walking the
+builtins, and the names found in each module introspected so far."""
+
+    def __init__(self, cache=None, jobs=pyfuscate.default_jobs, timeout=None):
+        self.known_names = pyfuscate.pyfuscate(pyfuscate.global_names).known_names
+        self.cache = cache
+        self.jobs = jobs
+        self.timeout = timeout
+        self.modules = {}
+        self.lock = threading.Lock()
+
+    def preload(self, requirements):
+        """Introspects every module listed in the 'requirements' file object up front."""
+        names = pyfuscate.read_requirements(requirements)
+        self.modules.update(pyfuscate.introspect_modules(names, self.cache, self.jobs, self.timeout))
+
+    def introspect(self, name):
+        """Returns the names found in the module 'name', introspecting it (in a
+child process, as pyfuscate.introspect_modules() does) the first time.  The
+lock is not held while the module is imported, so a slow import only holds up
+the requests that wait for that module."""
+        self.lock.acquire()
+        try:
+            if name in self.modules:
+                return self.modules[name]
+            if self.cache:
+                names = self.cache.cached(name)
+                if names is not None:
+                    self.modules[name] = names
+                    return names
+        finally:
+            self.lock.release()
+        names = pyfuscate.introspect_modules([name], None, self.jobs, self.timeout)[name]
+        self.lock.acquire()
+        try:
+            if name not in self.modules:
+                self.modules[name] = names
+                if self.cache:
+                    self.cache.update(name, names)
+            return self.modules[name]
+        finally:
+            self.lock.release()
+
+
+class session(pyfuscate.pyfuscate):
+    """A pyfuscate for a single request, whose known names are an overlay on
+the warm state's."""
+
+    def __init__(self, state, preserve_names=(), counter=0):
+        pyfuscate.pyfuscate.__init__(self, (), walk_names=False)
+        self.state = state
+        self.known_names = pyfuscate.overlay_registry(state.known_names, preserve_names)
+        self.counter = counter
+
+    def introspect(self, name):
+        return self.state.introspect(name)
+
+
+def handle(state, line):
+    """Returns the response to the request on 'line', as a line of JSON."""
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get('id')
+        source = request['source'].encode('utf-8')
+        action = request.get('action', 'obfuscate')
+        if action == 'obfuscate':
+            preserve_names = request.get('preserve', [])
+            if isinstance(preserve_names, basestring):
+                preserve_names = preserve_names.split()
+            obfu = session(state, preserve_names, int(request.get('count', 0)))
+            output = ''.join(obfu.iter_chunks(StringIO(source).readline))
+        elif action == 'minify':
+            output = pyminifier.minify(source)
+        else:
+            raise ValueError("unknown action '%s'" % action)
+        response = {'id': request_id, 'output': output.decode('utf-8')}
+    except Exception, e:
+        response = {'id': request_id, 'error': '%s: %s' % (e.__class__.__name__, e)}
+    return json.dumps(response) + '\n'
+
+
+class request_handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            if line.strip():
+                self.wfile.write(handle(self.server.state, line))
+                self.wfile.flush()
+
+
+class server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, state):
+        self.state = state
+        if os.path.exists(path):
+            os.remove(path)
+        SocketServer.UnixStreamServer.__init__(self, path, request_handler)
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [OPTION]...')
+    parser.add_option('--socket',
+                      action='store',
+                      type='string',
+                      dest='socket_path',
+                      metavar='PATH',
+                      help='Serve requests on the Unix socket at PATH instead of stdin',
+                      default='')
+    parser.add_option('--preload',
+                      action='store',
+                      type='string',
+                      dest='preload_file',
+                      metavar='FILE',
+                      help='Introspect the modules listed in FILE (one per line, requirements style) at startup',
+                      default='')
+    parser.add_option('--cache-dir',
+                      action='store',
+                      type='string',
+                      dest='cache_dir',
+                      metavar='DIR',
+                      help='Cache the names found in imported modules under DIR [default=%default]',
+                      default=pyfuscate.default_cache_dir())
+    parser.add_option('--no-cache',
+                      action='store_false',
+                      dest='use_cache',
+                      help='Always import modules to find their names, ignoring the cache',
+                      default=True)
+    parser.add_option('-j',
+                      '--jobs',
+                      action='store',
+                      type='int',
+                      dest='jobs',
+                      help='Number of worker processes used to introspect imported modules, 0 to import them in the server process [default=%default]',
+                      default=pyfuscate.default_jobs)
+    parser.add_option('--import-timeout',
+                      action='store',
+                      type='float',
+                      dest='import_timeout',
+                      metavar='SECONDS',
+                      help='Give up on a module that takes longer than SECONDS to introspect [default=%default]',
+                      default=30.0)
+    (options, args) = parser.parse_args()
+    cache = None
+    if options.use_cache:
+        cache = pyfuscate.name_cache(options.cache_dir)
+    state = warm_state(cache, options.jobs, options.import_timeout)
+    if options.preload_file:
+        state.preload(open(options.preload_file, 'r'))
+    if options.socket_path:
+        serve = server(options.socket_path, state)
+        try:
+            serve.serve_forever()
+        finally:
+            os.remove(options.socket_path)
+    else:
+        for line in iter(sys.stdin.readline, ''):
+            if line.strip():
+                sys.stdout.write(handle(state, line))
+                sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
@@ -1,360 +1,689 @@
-#!/usr/bin/env python
-# -*- coding: utf-8 -*-
-
-# Meta
-__version__ = '1.1'
-__license__ = "GNU General Public License (GPL) Version 3"
-__version_info__ = (1, 1)
-__author__ = 'James Pond <nlog2n@outlook.com>'
-
-import os, sys, re
-from pyparsing import QuotedString, Suppress, Keyword, Optional, Word, Literal, ZeroOrMore, alphanums, restOfLine, replaceWith, pythonStyleComment, printables
-
-"""
-Python Minifier:  Reduces the size of Python code for use on embedded platforms.
-
-Performs the following:
-    1) Removes docstrings.
-    2) Removes comments.
-    3) Minimizes code indentation.
-    4) Joins multiline pairs of parentheses, braces, and brackets (and removes extraneous whitespace within).
-    5) Preserves shebangs and encoding info (e.g. "# -- coding: utf-8 --").
-"""
-
-# Compile our regular expressions for speed
-multiline_quoted_string_regex = re.compile(r'(\'\'\'|\"\"\")')
-not_quoted_string_regex = re.compile(r'(\".*\'\'\'.*\"|\'.*\"\"\".*\')')
-double_quoted_string_regex = re.compile(r'((?<!\\)".*?(?<!\\)")')
-single_quoted_string_regex = re.compile(r"((?<!\\)'.*?(?<!\\)')")
-whitespace = re.compile('\s*')
-trailing_newlines = re.compile(r'\n\n')
-shebang = re.compile('^#\!.*$')
-encoding = re.compile(".*coding[:=]\s*([-\w.]+)")
-comment = re.compile("(?!(\'|\")*#.*(\'|\"))\s*#.*")
-blank_lines = re.compile("\n\s*\n")
-#parens = re.compile("\((?P<parens>[^()]|\(\))*\)", re.MULTILINE|re.DOTALL)
-multiline_indicator = re.compile('\\\\(\s*#.*)?\n') # Also removes trailing comments: "test = 'blah \ # comment here"
-# Operators (for future use)
-#commas = re.compile("(?!\'.*\')\s*\,\s*\n*\s*") # To be replaced with ","
-#plus_signs = re.compile("(?!\'.*\')\s*\+\s*\n*\s*") # To be replaced with "+"
-#minus_signs = re.compile("(?!\'.*\')\s*\-\s*\n*\s*") # To be replaced with "-"
-#multiply_signs = re.compile("(?!\'.*\')\s*\*\s*\n*\s*") # To be replaced with "*"
-#divide_signs = re.compile("(?!\'.*\')\s*\/\s*\n*\s*") # To be replaced with "/"
-#less_signs = re.compile("(?!\'.*\')\s*\<\s*\n*\s*") # To be replaced with "<"
-#greater_signs = re.compile("(?!\'.*\')\s*\>\s*\n*\s*") # To be replaced with ">"
-#equal_signs = re.compile("(?!\'.*\')\s*\s*\=\s*\n*\s*") # To be replaced with "="
-#equals_signs = re.compile("(?!\'.*\')\s*\=\=\s*\n*\s*") # To be replaced with "=="
-#not_equal_signs = re.compile("(?!\'.*\')\s*\!\=\s*\n*\s*") # To be replaced with "!="
-#add_assign = re.compile("(?!\'.*\')\s*\+\=\s*\n*\s*") # To be replaced with "+="
-#sub_assign = re.compile("(?!\'.*\')\s*\-\=\s*\n*\s*") # To be replaced with "-="
-#modulus_assign = re.compile("(?!\'.*\')\s*\%\=\s*\n*\s*") # To be replaced with "%="
-#multiply_assign = re.compile("(?!\'.*\')\s*\*\=\s*\n*\s*") # To be replaced with "*="
-#powers_assign = re.compile("(?!\'.*\')\s*\*\*\=\s*\n*\s*") # To be replaced with "**="
-#divide_assign = re.compile("(?!\'.*\')\s*\/\=\s*\n*\s*") # To be replaced with "/="
-#truncate_divide_assign = re.compile("(?!\'.*\')\s*\/\/\=\s*\n*\s*") # To be replaced with "*//="
-#truncated_divide_signs = re.compile("(?!\'.*\')\s*\/\/\s*\n*\s*") # To be replaced with "//"
-#powers_signs = re.compile("(?!\'.*\')\s*\*\*\s*\n*\s*") # To be replaced with "**"
-#left_shift_signs = re.compile("(?!\'.*\')\s*\<\<\s*\n*\s*") # To be replaced with "<<"
-#right_shift_signs = re.compile("(?!\'.*\')\s*\*>\>\s*\n*\s*") # To be replaced with ">>"
-#modulos_signs = re.compile("(?!\'.*\')\s*\%\s*\n*\s*") # To be replaced with "%"
-#and_signs = re.compile("(?!\'.*\')\s*\&\s*\n*\s*") # To be replaced with "&"
-#or_signs = re.compile("(?!\'.*\')\s*\|\s*\n*\s*") # To be replaced with "|"
-#xor_signs = re.compile("(?!\'.*\')\s*\^\s*\n*\s*") # To be replaced with "^"
-#negation_signs = re.compile("(?!\'.*\')\s*\~\s*\n*\s*") # To be replaced with "~"
-
-def substitute_matches(matchlist, opener_regex, closer_regex, opener_sub, closer_sub):
-    """Replaces 'opener' and 'closer' in 'matchlist' with 'opener_sub' and 'closer_sub'"""
-    preoutput = ""
-    for item in matchlist:
-        if item:
-            if item[0] == '"':
-                # Sub out all the matching pairs with something so they don't match later on (we'll change them back at the end)
-                item = opener_regex.sub('%s' % opener_sub, item)
-                item = closer_regex.sub('%s' % closer_sub, item)
-                preoutput += item
-            else:
-                preoutput += item
-    line = "".join(preoutput)
-    return line
-
-def join_multiline_pairs(text, pair="()"):
-    """Finds and removes newlines in multiline matching pairs of characters in 'text'.
-    For example, "(.*\n.*), {.*\n.*}, or [.*\n.*]").
-    By default it joins parens () but it will join any two characters it is passed in the 'pair' variable.
-    """
-    # Readability variables
-    opener = pair[0]
-    closer = pair[1]
-
-    # Tracking variables
-    inside_pair = False
-    inside_quotes = False
-    inside_double_quotes = False
-    inside_single_quotes = False
-    quoted_string = False
-    openers = 0
-    closers = 0
-    linecount = 0
-
-    # Static variables
-    opener_sub = '###OPENER###'
-    closer_sub = '###CLOSER###'
-
-    # Regular expressions
-    opener_regex = re.compile('\%s' % opener)
-    closer_regex = re.compile('\%s' % closer)
-    opener_sub_regex = re.compile('(?!(\'|\"))%s(?!(\'|\"))' % opener_sub)
-    closer_sub_regex = re.compile('(?!(\'|\"))%s(?!(\'|\"))' % closer_sub)
-
-    output = ""
-
-    for line in text.split('\n'):
-        escaped = False
-        multline_match = multiline_quoted_string_regex.search(line)
-        not_quoted_string_match = not_quoted_string_regex.search(line)
-        if multline_match and not not_quoted_string_match and not quoted_string:
-            output += line + '\n'
-            quoted_string = True
-        elif quoted_string and multiline_quoted_string_regex.search(line) and not quoted_string:
-            output += line + '\n'
-            quoted_string = False
-        elif opener_regex.search(line) or closer_regex.search(line) or inside_pair:
-            for character in line:
-                if character == opener:
-                    if not escaped:
-                        openers += 1
-                        inside_pair = True
-                        output += character
-                    else:
-                        escaped = False
-                        output += character
-                elif character == closer:
-                    if not escaped:
-                        if openers == (closers + 1) and openers != 0:
-                            closers = 0
-                            openers = 0
-                            inside_pair = False
-                            output += character
-                        else:
-                            closers += 1
-                            output += character
-                    else:
-                        escaped = False
-                        output += character
-                elif character == '\\':
-                    if escaped:
-                        escaped = False
-                        output += character
-                    else:
-                        escaped = True
-                        output += character
-                elif character == '"' and escaped:
-                    output += character
-                    escaped = False
-                elif character == "'" and escaped:
-                    output += character
-                    escaped = False
-                elif character == '"' and inside_quotes:
-                    if inside_single_quotes:
-                        output += character
-                    else:
-                        inside_quotes = False
-                        inside_double_quotes = False
-                        output += character
-                elif character == "'" and inside_quotes:
-                    if inside_double_quotes:
-                        output += character
-                    else:
-                        inside_quotes = False
-                        inside_single_quotes = False
-                        output += character
-                elif character == '"' and not inside_quotes:
-                    inside_quotes = True
-                    inside_double_quotes = True
-                    output += character
-                elif character == "'" and not inside_quotes:
-                    inside_quotes = True
-                    inside_single_quotes = True
-                    output += character
-                elif character == ' ' and inside_pair and not inside_quotes:
-                    pass
-                else:
-                    if escaped:
-                        escaped = False
-                    output += character
-            if inside_pair == False:
-                output += '\n'
-        else:
-            output += line + '\n'
-
-    # Clean up
-    output = opener_sub_regex.sub('%s' % opener, output)
-    output = closer_sub_regex.sub('%s' % closer, output)
-    output = trailing_newlines.sub('\n', output)
-
-    return output
-
-def dedent(source):
-    """Minimizes indentation to save precious bytes"""
-    indentation_list = []
-    output = ""
-    # First find all the levels of indentation
-    for line in source.split('\n'):
-        indentation_level = len(line.rstrip()) - len(line.strip())
-        if indentation_level not in indentation_list:
-            indentation_list.append(indentation_level)
-    # Now we can reduce each line's indentation to the minimal value
-    for line in source.split('\n'):
-        indentation_level = len(line.rstrip()) - len(line.strip())
-        for i,v in enumerate(indentation_list):
-            if indentation_level == v:
-                output += " " * i + line.lstrip() + "\n"
-    return output
-
-    #def reduce_operators(source):
-    #"""Removes spaces and newlines between operators"""
-    source = multiline_indicator.sub('', source)
-
-    # The following is meant to remove space between operators but it currently has issues (working on it).
-    #source = commas.sub(',', source)
-    #source = plus_signs.sub('+', source)
-    #source = minus_signs.sub('-', source)
-    #source = multiply_signs.sub('*', source)
-    #source = divide_signs.sub('/', source)
-    #source = less_signs.sub('<', source)
-    #source = greater_signs.sub('>', source)
-    #source = equal_signs.sub('=', source)
-    #source = equals_signs.sub('==', source)
-    #source = not_equal_signs.sub('<!=', source)
-    #source = add_assign.sub('+=', source)
-    #source = sub_assign.sub('-=', source)
-    #source = modulus_assign.sub('%=', source)
-    #source = multiply_assign.sub('*=', source)
-    #source = powers_assign.sub('**=', source)
-    #source = divide_assign.sub('/=', source)
-    #source = truncate_divide_assign.sub('//=', source)
-    #source = truncated_divide_signs.sub('//', source)
-    #source = powers_signs.sub('**', source)
-    #source = left_shift_signs.sub('<<', source)
-    #source = right_shift_signs.sub('>>', source)
-    #source = modulos_signs.sub('%', source)
-    #source = and_signs.sub('&', source)
-    #source = or_signs.sub('|', source)
-    #source = xor_signs.sub('^', source)
-    #source = negation_signs.sub('~', source)
-    #return source
-
-def empty_method():
-    """Just a test method.  This should be replaced with 'def empty_method: pass'"""
-
-def fix_empty_methods(source):
-    """Appends 'pass' to empty methods/functions (i.e. where there was nothing but a docstring before we removed docstrings =)"""
-    def_indentation_level = 0
-    output = ""
-    just_matched = False
-    previous_line = None
-    method = re.compile(r'^\s*def\s*.*\(.*\):.*$')
-    for line in source.split('\n'):
-        if len(line.strip()) > 0: # Don't look at blank lines
-            if just_matched == True:
-                this_indentation_level = len(line.rstrip()) - len(line.strip())
-                if def_indentation_level == this_indentation_level:
-                    # This method is empty, insert a 'pass' statement
-                    output += "%s pass\n%s\n" % (previous_line, line)
-                else:
-                    output += "%s\n%s\n" % (previous_line, line)
-                just_matched = False
-            elif method.match(line):
-                def_indentation_level = len(line) - len(line.strip())
-                just_matched = True
-                previous_line = line
-            else:
-                output += "%s\n" % line
-        else:
-            output += "\n"
-    return output
-
-def remove_docstrings(source):
-    """Removes docstrings from the source"""
-    method = (
-        Suppress(Keyword("def") +
-        Word(alphanums+"_") +
-        '(' + ZeroOrMore(Word(alphanums+"_")) + ')' + ":")
-    )
-    doc = Keyword("__doc__")
-    
-    # This removes multiline docstrings
-    string = ( 
-        (QuotedString(quoteChar='\"\"\"', escChar='\\', multiline=True) | \
-        QuotedString(quoteChar="\'\'\'", escChar='\\', multiline=True))
-    )
-    multiLineDocstring = (Optional(doc + Literal('=') + Optional('\\')) + string)
-    multiLineDocstring.setParseAction(replaceWith(""))
-    source = multiLineDocstring.transformString(source)
-
-    # This removes single line docstrings
-    singleLineDocstring = (
-        Suppress(method) +
-        (QuotedString(quoteChar='"', escChar='\\', multiline=False) | \
-        QuotedString(quoteChar="'", escChar='\\', multiline=False))
-    )
-    singleLineDocstring.setParseAction(replaceWith(""))
-
-    return singleLineDocstring.transformString(source)
-
-def minify(source):
-    """Remove all docstrings, comments, blank lines, and minimize code indentation from 'source' (string)."""
-    preserved_shebang = None
-    preserved_encoding = None
-
-    source = remove_docstrings(source)
-
-    # This loop is for things that must be preserved precisely
-    for line in source.split('\n')[0:2]:
-        # Save the first comment line if it starts with a shebang (#!) so we can re-add it later
-        if shebang.match(line):
-            preserved_shebang = line
-
-        # Save the encoding string so we can re-add it later
-        if encoding.match(line):
-            preserved_encoding = line
-
-    # Remove comments
-    source = comment.sub('', source)
-
-    # TODO: This currently isn't working for some reason
-    #       probably due to escape character detection in join_multiline_pairs()
-    # Remove multilines (e.g. lines that end with '\' followed by a newline)
-    source = multiline_indicator.sub('', source)
-
-    # Join multiline pairs of parens, brackets, and braces
-    source = join_multiline_pairs(source)
-    #source = join_multiline_pairs(source, '[]')
-    #source = join_multiline_pairs(source, '{}')
-
-    # Re-add preseved items
-    if preserved_encoding:
-        source = preserved_encoding + "\n" + source
-    if preserved_shebang:
-        source = preserved_shebang + "\n" + source
-
-    # Minimize indentation
-    source = dedent(source)
-
-    # Remove empty (i.e. single line) methods/functions
-    source = fix_empty_methods(source)
-
-    # Remove blank lines
-    source = blank_lines.sub('\n', source)
-
-    return source
-
-def main():
-    if len(sys.argv) > 1:
-        source = open(sys.argv[1]).read()
-        print minify(source)
-    else:
-        print "Usage: pyminifier.py <python source file>"
-
-if __name__ == "__main__":
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Meta
+__version__ = '1.1'
+__license__ = "GNU General Public License (GPL) Version 3"
+__version_info__ = (1, 1)
+__author__ = 'James Pond <nlog2n@outlook.com>'
+
+import os, sys, re, stat, tokenize, optparse, multiprocessing, itertools, collections, tempfile, shutil
+import profiler, artifact, streaming
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+"""
+Python Minifier:  Reduces the size of Python code for use on embedded platforms.
+
+Performs the following:
+    1) Removes docstrings.
+    2) Removes comments.
+    3) Minimizes code indentation.
+    4) Joins multiline pairs of parentheses, braces, and brackets (and removes extraneous whitespace within).
+    5) Preserves shebangs and encoding info (e.g. "# -- coding: utf-8 --").
+"""
+
+# Compile our regular expressions for speed
+multiline_quoted_string_regex = re.compile(r'(\'\'\'|\"\"\")')
+not_quoted_string_regex = re.compile(r'(\".*\'\'\'.*\"|\'.*\"\"\".*\')')
+double_quoted_string_regex = re.compile(r'((?<!\\)".*?(?<!\\)")')
+single_quoted_string_regex = re.compile(r"((?<!\\)'.*?(?<!\\)')")
+whitespace = re.compile('\s*')
+trailing_newlines = re.compile(r'\n\n')
+quoted_string = r'\'\'\'(?:\\.|[^\\])*?\'\'\'|"""(?:\\.|[^\\])*?"""|\'(?:\\.|[^\\\'\n])*\'|"(?:\\.|[^\\"\n])*"'
+pair_scanner = re.compile(r"""
+    (?P<string>%s)
+    |(?P<comment>\#[^\n]*)
+    |(?P<space>(?:\s|\\\r?\n)+)
+    |(?P<bracket>[()\[\]{}])
+    |(?P<other>[^'"\#\s\\()\[\]{}]+|.)
+    """ % quoted_string, re.VERBOSE|re.DOTALL)
+string_delimiters = re.compile(r'\\.|\'\'\'|"""|\'|"|#')
+shebang = re.compile('^#\!.*$')
+encoding = re.compile(".*coding[:=]\s*([-\w.]+)")
+statement_start = re.compile(r'[A-Za-z_]')
+continuing_keywords = re.compile(r'(?:else|elif|except|finally)\b')
+string_start = re.compile(r'[ \t]*[uUbB]?[rR]?[\'"]')
+docstring_statement = re.compile(r'[ \t]*(?:[uUbB]?[rR]?(?:%s)[ \t]*)+(?:#[^\n]*)?\r?\n?$' % quoted_string, re.DOTALL)
+block_header = re.compile(r'[ \t]*(?:async[ \t]+)?(?:def|class)\b')
+header_end = re.compile(r':[ \t]*(?:#.*)?$')
+parallel_min_chunk = 65536 # Smaller chunks cost more to hand to a worker than to minify
+parallel_max_chunk = 1 << 22 # Bounds the memory taken by the chunks read ahead for the workers
+comment = re.compile("(?!(\'|\")*#.*(\'|\"))\s*#.*")
+blank_lines = re.compile("\n\s*\n")
+#parens = re.compile("\((?P<parens>[^()]|\(\))*\)", re.MULTILINE|re.DOTALL)
+multiline_indicator = re.compile('\\\\(\s*#.*)?\n') # Also removes trailing comments: "test = 'blah \ # comment here"
+# Operators (for future use)
+#commas = re.compile("(?!\'.*\')\s*\,\s*\n*\s*") # To be replaced with ","
+#plus_signs = re.compile("(?!\'.*\')\s*\+\s*\n*\s*") # To be replaced with "+"
+#minus_signs = re.compile("(?!\'.*\')\s*\-\s*\n*\s*") # To be replaced with "-"
+#multiply_signs = re.compile("(?!\'.*\')\s*\*\s*\n*\s*") # To be replaced with "*"
+#divide_signs = re.compile("(?!\'.*\')\s*\/\s*\n*\s*") # To be replaced with "/"
+#less_signs = re.compile("(?!\'.*\')\s*\<\s*\n*\s*") # To be replaced with "<"
+#greater_signs = re.compile("(?!\'.*\')\s*\>\s*\n*\s*") # To be replaced with ">"
+#equal_signs = re.compile("(?!\'.*\')\s*\s*\=\s*\n*\s*") # To be replaced with "="
+#equals_signs = re.compile("(?!\'.*\')\s*\=\=\s*\n*\s*") # To be replaced with "=="
+#not_equal_signs = re.compile("(?!\'.*\')\s*\!\=\s*\n*\s*") # To be replaced with "!="
+#add_assign = re.compile("(?!\'.*\')\s*\+\=\s*\n*\s*") # To be replaced with "+="
+#sub_assign = re.compile("(?!\'.*\')\s*\-\=\s*\n*\s*") # To be replaced with "-="
+#modulus_assign = re.compile("(?!\'.*\')\s*\%\=\s*\n*\s*") # To be replaced with "%="
+#multiply_assign = re.compile("(?!\'.*\')\s*\*\=\s*\n*\s*") # To be replaced with "*="
+#powers_assign = re.compile("(?!\'.*\')\s*\*\*\=\s*\n*\s*") # To be replaced with "**="
+#divide_assign = re.compile("(?!\'.*\')\s*\/\=\s*\n*\s*") # To be replaced with "/="
+#truncate_divide_assign = re.compile("(?!\'.*\')\s*\/\/\=\s*\n*\s*") # To be replaced with "*//="
+#truncated_divide_signs = re.compile("(?!\'.*\')\s*\/\/\s*\n*\s*") # To be replaced with "//"
+#powers_signs = re.compile("(?!\'.*\')\s*\*\*\s*\n*\s*") # To be replaced with "**"
+#left_shift_signs = re.compile("(?!\'.*\')\s*\<\<\s*\n*\s*") # To be replaced with "<<"
+#right_shift_signs = re.compile("(?!\'.*\')\s*\*>\>\s*\n*\s*") # To be replaced with ">>"
+#modulos_signs = re.compile("(?!\'.*\')\s*\%\s*\n*\s*") # To be replaced with "%"
+#and_signs = re.compile("(?!\'.*\')\s*\&\s*\n*\s*") # To be replaced with "&"
+#or_signs = re.compile("(?!\'.*\')\s*\|\s*\n*\s*") # To be replaced with "|"
+#xor_signs = re.compile("(?!\'.*\')\s*\^\s*\n*\s*") # To be replaced with "^"
+#negation_signs = re.compile("(?!\'.*\')\s*\~\s*\n*\s*") # To be replaced with "~"
+
+def substitute_matches(matchlist, opener_regex, closer_regex, opener_sub, closer_sub):
+    """Replaces 'opener' and 'closer' in 'matchlist' with 'opener_sub' and 'closer_sub'"""
+    preoutput = ""
+    for item in matchlist:
+        if item:
+            if item[0] == '"':
+                # Sub out all the matching pairs with something so they don't match later on (we'll change them back at the end)
+                item = opener_regex.sub('%s' % opener_sub, item)
+                item = closer_regex.sub('%s' % closer_sub, item)
+                preoutput += item
+            else:
+                preoutput += item
+    line = "".join(preoutput)
+    return line
+
+def join_multiline_pairs(text, pairs="()[]{}"):
+    """Finds and removes newlines in multiline matching pairs of characters in 'text'.
+    For example, "(.*\n.*), {.*\n.*}, or [.*\n.*]").
+    By default it joins parens (), brackets [] and braces {}, nested in any combination, in one pass; it will join
+    any pairs of characters it is passed in the 'pairs' variable.  Strings (including triple-quoted ones) are left
+    alone, and inside a pair comments are dropped and whitespace is squeezed out where it is not needed.
+    """
+    openers = pairs[0::2]
+    closers = pairs[1::2]
+    # Outside of any pair only strings, comments and openers need a closer look
+    outside_scanner = re.compile('%s|\\#[^\\n]*|[%s]' % (quoted_string, re.escape(openers)), re.DOTALL)
+    output = []
+    depth = 0
+    pending_space = False
+    position = 0
+    while True:
+        if not depth:
+            match = outside_scanner.search(text, position)
+            if not match:
+                output.append(text[position:])
+                break
+            output.append(text[position:match.end()])
+            position = match.end()
+            if match.group() in openers:
+                depth = 1
+            continue
+        match = pair_scanner.match(text, position)
+        if not match:
+            break
+        position = match.end()
+        kind = match.lastgroup
+        item = match.group()
+        if kind == 'space' or kind == 'comment':
+            pending_space = True
+            continue
+        if pending_space:
+            previous = output[-1][-1]
+            if (previous.isalnum() or previous == '_') and (item[0].isalnum() or item[0] == '_'):
+                output.append(' ')
+            pending_space = False
+        if kind == 'bracket':
+            if item in openers:
+                depth += 1
+            elif item in closers:
+                depth -= 1
+        output.append(item)
+    return ''.join(output)
+
+def open_quote_after(line, open_quote=None):
+    """Returns the triple quote still open at the end of 'line' (given the one open at its start), or None"""
+    for match in string_delimiters.finditer(line):
+        delimiter = match.group()
+        if open_quote:
+            if delimiter == open_quote:
+                open_quote = None
+        elif delimiter == '#':
+            break
+        elif delimiter[0] != '\\':
+            open_quote = delimiter
+    if open_quote == '"' or open_quote == "'":
+        return None
+    return open_quote
+
+def dedent_lines(lines):
+    """Generator that minimizes the indentation of each line from the iterator 'lines', yielding them one at a time
+    (each ending with a newline).  The widths of the blocks enclosing the current line are kept on a stack, sorted,
+    so a line's new indentation is the rank of its width among them and does not depend on the order in which the
+    widths first appear.  Lines inside triple-quoted strings are passed through untouched."""
+    widths = [0]
+    open_quote = None
+    for line in lines:
+        if line[-1:] == '\n':
+            line = line[:-1]
+        if open_quote:
+            open_quote = open_quote_after(line, open_quote)
+            yield line + '\n'
+            continue
+        stripped = line.lstrip()
+        if not stripped.strip():
+            yield stripped + '\n'
+            continue
+        if stripped[0] == '#':
+            # Comments do not open or close blocks
+            yield ' ' * (len(widths) - 1) + stripped + '\n'
+            continue
+        width = len(line) - len(stripped)
+        while width < widths[-1]:
+            widths.pop()
+        if width > widths[-1]:
+            widths.append(width)
+        open_quote = open_quote_after(stripped)
+        yield ' ' * (len(widths) - 1) + stripped + '\n'
+
+def dedent(source):
+    """Minimizes indentation to save precious bytes"""
+    return ''.join(dedent_lines(source.split('\n')))
+
+    #def reduce_operators(source):
+    #"""Removes spaces and newlines between operators"""
+    source = multiline_indicator.sub('', source)
+
+    # The following is meant to remove space between operators but it currently has issues (working on it).
+    #source = commas.sub(',', source)
+    #source = plus_signs.sub('+', source)
+    #source = minus_signs.sub('-', source)
+    #source = multiply_signs.sub('*', source)
+    #source = divide_signs.sub('/', source)
+    #source = less_signs.sub('<', source)
+    #source = greater_signs.sub('>', source)
+    #source = equal_signs.sub('=', source)
+    #source = equals_signs.sub('==', source)
+    #source = not_equal_signs.sub('<!=', source)
+    #source = add_assign.sub('+=', source)
+    #source = sub_assign.sub('-=', source)
+    #source = modulus_assign.sub('%=', source)
+    #source = multiply_assign.sub('*=', source)
+    #source = powers_assign.sub('**=', source)
+    #source = divide_assign.sub('/=', source)
+    #source = truncate_divide_assign.sub('//=', source)
+    #source = truncated_divide_signs.sub('//', source)
+    #source = powers_signs.sub('**', source)
+    #source = left_shift_signs.sub('<<', source)
+    #source = right_shift_signs.sub('>>', source)
+    #source = modulos_signs.sub('%', source)
+    #source = and_signs.sub('&', source)
+    #source = or_signs.sub('|', source)
+    #source = xor_signs.sub('^', source)
+    #source = negation_signs.sub('~', source)
+    #return source
+
+def empty_method():
+    """Just a test method.  This should be replaced with 'def empty_method: pass'"""
+
+def fix_empty_methods(source):
+    """Appends 'pass' to empty methods/functions (i.e. where there was nothing but a docstring before we removed docstrings =)"""
+    def_indentation_level = 0
+    output = ""
+    just_matched = False
+    previous_line = None
+    method = re.compile(r'^\s*def\s*.*\(.*\):.*$')
+    for line in source.split('\n'):
+        if len(line.strip()) > 0: # Don't look at blank lines
+            if just_matched == True:
+                this_indentation_level = len(line.rstrip()) - len(line.strip())
+                if def_indentation_level == this_indentation_level:
+                    # This method is empty, insert a 'pass' statement
+                    output += "%s pass\n%s\n" % (previous_line, line)
+                else:
+                    output += "%s\n%s\n" % (previous_line, line)
+                just_matched = False
+            elif method.match(line):
+                def_indentation_level = len(line) - len(line.strip())
+                just_matched = True
+                previous_line = line
+            else:
+                output += "%s\n" % line
+        else:
+            output += "\n"
+    return output
+
+def remove_docstrings(source):
+    """Removes docstrings from the source.  Only real docstrings (the first statement of a module, or of a block
+    opened by a def or class line ending in a colon) are removed, found a line at a time without tokenizing, as this
+    is the fallback for sources that cannot be tokenized.  'pass' replaces a docstring that was the only statement of
+    its block."""
+    lines = source.splitlines(True)
+    output = []
+    expect_docstring = True # The first statement of the module
+    in_block = False
+    in_header = False
+    open_quote = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if open_quote:
+            output.append(line)
+            open_quote = open_quote_after(line, open_quote)
+            continue
+        if not line.strip() or line.lstrip()[0] == '#':
+            output.append(line)
+            continue
+        if expect_docstring and string_start.match(line):
+            end = i
+            quote = open_quote_after(line)
+            while quote and end < len(lines):
+                quote = open_quote_after(lines[end], quote)
+                end += 1
+            if not quote and docstring_statement.match(''.join(lines[i - 1:end])):
+                i = end
+                indent = line[:len(line) - len(line.lstrip(' \t'))]
+                following = end
+                while following < len(lines) and (not lines[following].strip() or lines[following].lstrip()[0] == '#'):
+                    following += 1
+                if in_block and (following == len(lines) or not lines[following].startswith(indent)):
+                    output.append(indent + 'pass\n') # The block ends with the docstring
+                expect_docstring = False
+                continue
+        expect_docstring = False
+        if block_header.match(line):
+            in_header = True
+        if in_header and header_end.search(line.rstrip('\r\n')):
+            in_header = False
+            expect_docstring = True
+            in_block = True
+        output.append(line)
+        open_quote = open_quote_after(line)
+    return ''.join(output)
+
+def strip_comment_tokens(tokens):
+    """Drops comments and non-logical newlines (blank lines and the line breaks inside brackets) from 'tokens'"""
+    for token in tokens:
+        if token[0] != tokenize.COMMENT and token[0] != tokenize.NL:
+            yield token
+
+def strip_docstring_tokens(tokens, module_docstring=True):
+    """Drops the docstrings of modules, classes and functions from 'tokens' (which must not contain comments or NL tokens).
+    A 'pass' statement takes the place of a docstring that was the only statement in its block.
+    Unless 'module_docstring' is set, 'tokens' are taken to come from later in a module than its first statement."""
+    depth = 0
+    expect_docstring = module_docstring # The first statement of the module
+    docstring = []
+    dropped_newline = None
+    header = None
+    line_start = True
+    for token in tokens:
+        tok_type = token[0]
+        if dropped_newline:
+            if depth and (tok_type == tokenize.DEDENT or tok_type == tokenize.ENDMARKER):
+                yield (tokenize.NAME, 'pass')
+                yield dropped_newline
+            dropped_newline = None
+        if docstring:
+            if tok_type == tokenize.STRING:
+                docstring.append(token)
+                continue
+            elif tok_type == tokenize.NEWLINE:
+                dropped_newline = token
+                docstring = []
+                continue
+            else:
+                # Just a string expression at the start of a longer statement
+                for item in docstring:
+                    yield item
+                docstring = []
+                line_start = False
+        if tok_type == tokenize.INDENT:
+            depth += 1
+            expect_docstring = header in ('def', 'class')
+        elif tok_type == tokenize.DEDENT:
+            depth -= 1
+        elif tok_type == tokenize.NEWLINE:
+            if not line_start:
+                expect_docstring = False
+            line_start = True
+        elif line_start:
+            if tok_type == tokenize.STRING and expect_docstring:
+                docstring = [token]
+                expect_docstring = False
+                continue
+            header = token[1]
+            if header == 'async':
+                header = 'def'
+            line_start = False
+        yield token
+
+def untokenize_minimal(tokens):
+    """Turns 'tokens' back into source, one logical line per line, indenting each block by a single space and
+    only putting spaces between tokens where they are needed to keep them apart."""
+    depth = 0
+    line_start = True
+    previous = None
+    previous_type = None
+    for token in tokens:
+        tok_type, tok_string = token[0], token[1]
+        if tok_type == tokenize.INDENT:
+            depth += 1
+        elif tok_type == tokenize.DEDENT:
+            depth -= 1
+        elif tok_type == tokenize.NEWLINE:
+            if not line_start:
+                yield '\n'
+            line_start = True
+        elif tok_type == tokenize.ENDMARKER:
+            if not line_start:
+                yield '\n'
+            line_start = True
+        elif tok_string:
+            if line_start:
+                yield ' ' * depth
+                line_start = False
+            elif (previous[-1].isalnum() or previous[-1] == '_') and (tok_string[0].isalnum() or tok_string[0] == '_'):
+                yield ' '
+            elif previous_type == tokenize.NUMBER and (tok_string[0].isalnum() or tok_string[0] == '.'):
+                yield ' '
+            elif previous_type == tokenize.STRING and tok_type == tokenize.STRING and tok_string[0] == previous[-1]:
+                yield ' ' # Or '' 'abc' would run together into the start of a triple-quoted string
+            yield tok_string
+            previous = tok_string
+            previous_type = tok_type
+
+def minify_tokens(tokens, profile=profiler.null, module_docstring=True):
+    """Minifies the token stream 'tokens' (as produced by tokenize.generate_tokens()) in a single pass, yielding the
+    output a piece at a time.  Comments, blank lines and docstrings are dropped, continued lines (inside brackets or
+    after a backslash) are joined and indentation is reduced to one space per level.  Each stage is timed in
+    'profile'.  'module_docstring' is passed on to strip_docstring_tokens()."""
+    tokens = profile.timed('strip_comment_tokens', strip_comment_tokens(profile.counted('tokens', tokens)))
+    tokens = profile.timed('strip_docstring_tokens', strip_docstring_tokens(tokens, module_docstring))
+    return profile.timed('untokenize_minimal', untokenize_minimal(tokens))
+
+def preserved_header(lines):
+    """Returns the shebang and encoding info among the first two 'lines' of a source, as lines to put back at the
+    top of its minified version.  No other comments are kept."""
+    header = []
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.startswith('#') and (shebang.match(line) or encoding.match(line)):
+            header.append(line + '\n')
+    return header
+
+def minify(source, profile=profiler.null, jobs=1):
+    """Remove all docstrings, comments, blank lines, and minimize code indentation from 'source' (string).
+    The work is done by minify_tokens() in one pass over the tokens; sources that cannot be tokenized fall back to
+    regex_minify().  The time spent in each stage is recorded in 'profile'.  With more than one of 'jobs' the source
+    is minified by parallel_minify() instead (if it is big enough to split), which gives the same output."""
+    if jobs > 1 and len(source) >= 2 * parallel_min_chunk:
+        return parallel_minify(source, jobs, profile)
+    header = preserved_header(source.split('\n', 2)[0:2])
+    try:
+        tokens = profile.timed('tokenize', tokenize.generate_tokens(StringIO(source).readline))
+        body = ''.join(minify_tokens(tokens, profile))
+    except (tokenize.TokenError, IndentationError):
+        profile.count('regex fallbacks')
+        return regex_minify(source, profile)
+    return ''.join(header) + body
+
+def iter_statement_chunks(lines, chunk_size):
+    """Generator that joins 'lines' into chunks of at least 'chunk_size' characters (but for the last), each of which
+    starts with a top-level statement: a line at column 0 that is not inside a triple-quoted string, does not follow a
+    decorator and does not start with else, elif, except or finally.  The first statement of the module is always in
+    the first chunk.  A line that only looks like the start of a statement (one inside brackets, say) leaves the chunk
+    before it unable to be tokenized on its own, which minify_chunk() checks for."""
+    chunk = []
+    size = 0
+    open_quote = None
+    seen_statement = False
+    after_decorator = False
+    for line in lines:
+        if not open_quote and line[:1] not in ' \t\f\r\n#':
+            if seen_statement and not after_decorator and size >= chunk_size \
+               and statement_start.match(line) and not continuing_keywords.match(line):
+                yield ''.join(chunk)
+                chunk = []
+                size = 0
+            seen_statement = True
+            after_decorator = line[0] == '@'
+        open_quote = open_quote_after(line, open_quote)
+        chunk.append(line)
+        size += len(line)
+    yield ''.join(chunk)
+
+def split_statements(source, chunk_size):
+    """Splits 'source' into chunks at its top-level statements, as iter_statement_chunks() does."""
+    return list(iter_statement_chunks(source.splitlines(True), chunk_size))
+
+def minify_chunk(args):
+    """Minifies a chunk of source from iter_statement_chunks() in a worker of parallel_minify().  'args' is the chunk
+    and whether it is the first of its module.  Returns None if the chunk cannot be tokenized on its own."""
+    chunk, first = args
+    try:
+        return ''.join(minify_tokens(tokenize.generate_tokens(StringIO(chunk).readline), module_docstring=first))
+    except (tokenize.TokenError, IndentationError):
+        return None
+
+def parallel_minify(source, jobs, profile=profiler.null, chunk_size=None):
+    """Does what minify() does, giving the same output, but in 'jobs' worker processes, each minifying chunks of
+    'source' split at its top-level statements by split_statements().  Nothing carries over from one top-level
+    statement to the next but whether the module docstring may still come, so the minified chunks only need to be
+    joined in order.  If any chunk cannot be tokenized on its own (the split went wrong, or the source cannot be
+    tokenized at all) the whole source is minified by minify() instead.  The chunks are at least 'chunk_size'
+    characters long, by default enough for about four per worker."""
+    if chunk_size is None:
+        chunk_size = max(len(source) // (jobs * 4), parallel_min_chunk)
+    profile.start('split_statements')
+    chunks = split_statements(source, chunk_size)
+    profile.stop('split_statements')
+    profile.count('chunks', len(chunks))
+    if len(chunks) < 2:
+        return minify(source, profile)
+    profile.start('minify_chunks')
+    pool = multiprocessing.Pool(min(jobs, len(chunks)))
+    try:
+        bodies = pool.map(minify_chunk, [(chunk, not i) for i, chunk in enumerate(chunks)], 1)
+    finally:
+        pool.close()
+        pool.join()
+    profile.stop('minify_chunks')
+    if None in bodies:
+        profile.count('parallel fallbacks')
+        return minify(source, profile)
+    return ''.join(preserved_header(source.split('\n', 2)[0:2]) + bodies)
+
+def iter_parallel_minified(lines, jobs, chunk_size, profile=profiler.null):
+    """Generator that yields, in order, the chunks of the source in 'lines' split by iter_statement_chunks() and
+    minified in 'jobs' worker processes.  Only two chunks per worker are read ahead, so the memory used does not grow
+    with the source.  None is yielded for a chunk that cannot be tokenized on its own."""
+    pool = multiprocessing.Pool(jobs)
+    pending = collections.deque()
+    try:
+        for i, chunk in enumerate(iter_statement_chunks(lines, chunk_size)):
+            profile.count('chunks')
+            pending.append(pool.apply_async(minify_chunk, ((chunk, not i),)))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def minify_file(fileh, out, profile=profiler.null, jobs=1, chunk_size=None):
+    """Writes the minified source read from the file object 'fileh' to the file object 'out', with a newline after it:
+    the same output as minify() gives (and main() prints), but the source is read and the output written as the
+    tokens go by, so a source of any size takes about the same memory.  With more than one of 'jobs' the work is
+    split as by parallel_minify(), into chunks of at least 'chunk_size' characters; if it is given, even a source
+    too small to be worth splitting is split.  If the source cannot be tokenized 'fileh' is read again, whole, for
+    regex_minify(), and what was written to 'out' is thrown away; an 'out' that is not a regular file (a pipe or
+    /dev/null, say, which cannot be truncated) is written through a temporary file for that reason."""
+    try:
+        start = out.tell()
+        if not stat.S_ISREG(os.fstat(out.fileno()).st_mode):
+            raise IOError("not a regular file")
+        out.seek(start)
+    except (IOError, OSError, ValueError, AttributeError):
+        spool = tempfile.TemporaryFile('w+')
+        try:
+            minify_file(fileh, spool, profile, jobs, chunk_size)
+            spool.seek(0)
+            shutil.copyfileobj(spool, out)
+        finally:
+            spool.close()
+        return
+    first_lines = [fileh.readline(), fileh.readline()]
+    lines = itertools.chain(first_lines, fileh)
+    out.writelines(preserved_header(first_lines))
+    size = os.path.getsize(fileh.name)
+    if jobs > 1 and chunk_size is None and size >= 2 * parallel_min_chunk:
+        chunk_size = min(max(size // (jobs * 4), parallel_min_chunk), parallel_max_chunk)
+    try:
+        if jobs > 1 and chunk_size:
+            bodies = iter_parallel_minified(lines, jobs, chunk_size, profile)
+            for body in profile.timed('minify_chunks', bodies):
+                if body is None:
+                    bodies.close()
+                    profile.count('parallel fallbacks')
+                    fileh.seek(0)
+                    out.seek(start)
+                    out.truncate()
+                    return minify_file(fileh, out, profile)
+                out.write(body)
+        else:
+            tokens = profile.timed('tokenize', tokenize.generate_tokens(lines.next))
+            out.writelines(minify_tokens(tokens, profile))
+    except (tokenize.TokenError, IndentationError):
+        profile.count('regex fallbacks')
+        fileh.seek(0)
+        out.seek(start)
+        out.truncate()
+        out.write(regex_minify(fileh.read(), profile))
+    out.write('\n')
+
+def regex_minify(source, profile=profiler.null):
+    """Remove all docstrings, comments, blank lines, and minimize code indentation from 'source' (string).
+    This is the original line- and regex-based minifier; it copes with sources that cannot be tokenized."""
+    preserved_shebang = None
+    preserved_encoding = None
+
+    profile.start('remove_docstrings')
+    source = remove_docstrings(source)
+    profile.stop('remove_docstrings')
+
+    # This loop is for things that must be preserved precisely
+    for line in source.split('\n')[0:2]:
+        # Save the first comment line if it starts with a shebang (#!) so we can re-add it later
+        if shebang.match(line):
+            preserved_shebang = line
+
+        # Save the encoding string so we can re-add it later
+        if encoding.match(line):
+            preserved_encoding = line
+
+    # Remove comments
+    profile.start('comments')
+    source = comment.sub('', source)
+    profile.stop('comments')
+
+    # TODO: This currently isn't working for some reason
+    #       probably due to escape character detection in join_multiline_pairs()
+    # Remove multilines (e.g. lines that end with '\' followed by a newline)
+    profile.start('multiline_indicator')
+    source = multiline_indicator.sub('', source)
+    profile.stop('multiline_indicator')
+
+    # Join multiline pairs of parens, brackets, and braces
+    profile.start('join_multiline_pairs')
+    source = join_multiline_pairs(source)
+    profile.stop('join_multiline_pairs')
+
+    # Re-add preseved items
+    if preserved_encoding:
+        source = preserved_encoding + "\n" + source
+    if preserved_shebang:
+        source = preserved_shebang + "\n" + source
+
+    # Minimize indentation
+    profile.start('dedent')
+    source = dedent(source)
+    profile.stop('dedent')
+
+    # Remove empty (i.e. single line) methods/functions
+    profile.start('fix_empty_methods')
+    source = fix_empty_methods(source)
+    profile.stop('fix_empty_methods')
+
+    # Remove blank lines
+    profile.start('blank_lines')
+    source = blank_lines.sub('\n', source)
+    profile.stop('blank_lines')
+
+    return source
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [OPTION]... <python source file>', version='%prog ' + __version__)
+    parser.add_option('-o',
+                      '--output',
+                      action='store',
+                      type='string',
+                      dest='output_file',
+                      metavar='FILE',
+                      help='The FILE to write the minified output to [default=stdout]',
+                      default='')
+    parser.add_option('-j',
+                      '--jobs',
+                      action='store',
+                      type='int',
+                      dest='jobs',
+                      help='Minify in JOBS worker processes, splitting the file at its top-level statements (for very large files) [default=%default]',
+                      default=1)
+    artifact.add_options(parser)
+    parser.add_option('--profile',
+                      action='store',
+                      type='string',
+                      dest='profile_file',
+                      metavar='FILE',
+                      help='Write the time spent in each stage, and a count of the tokens, to FILE as JSON',
+                      default='')
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("a python source file must be given")
+    if options.artifact != 'py' and not options.output_file:
+        parser.error("an output file must be given with -o when using --artifact")
+    artifact.check_options(parser, options)
+    profile = profiler.null
+    if options.profile_file:
+        profile = profiler.profiler()
+    fileh = streaming.source_file(args[0])
+    if options.artifact == 'py':
+        # Plain source is written out as it is minified
+        out = sys.stdout
+        if options.output_file:
+            out = open(options.output_file, 'w')
+        minify_file(fileh, out, profile, options.jobs)
+        if out is not sys.stdout:
+            out.close()
+    else:
+        profile.start('read')
+        source = fileh.read()
+        profile.stop('read')
+        output = minify(source, profile, options.jobs) + '\n'
+        artifact.write_artifact(options.artifact, options.output_file, output, options.optimize, options.compression,
+                                options.compress_level)
+        if options.artifact == 'packed':
+            artifact.report_sizes(options.output_file, len(source), len(output))
+    fileh.close()
+    if options.profile_file:
+        profile.write(options.profile_file)
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+"""
+Streaming:  Reads source files a line at a time, in bounded memory.
+
+The tools read their input through source_file, which reads a file in
+binary chunks of a fixed size and hands out its lines one at a time, so that
+a generated module of several gigabytes never has to be held in memory
+whole.  (A memory map would be no better: the pages it has read count
+towards the resident size until the kernel needs them back.)
+
+The encoding of a file is found once, when it is opened, from the coding
+cookie (or UTF-8 byte order mark) in its first two lines as PEP 263 lays
+out.  Python 2's tokenizer works on the undecoded bytes, so there the lines
+are passed on as they are; on Python 3 they are decoded.
+"""
+
+import io, re, sys, codecs
+
+coding_cookie = re.compile(r'^[ \t\f]*#.*?coding[:=][ \t]*([-\w.]+)')
+blank_or_comment = re.compile(r'^[ \t\f]*(?:[#\r\n]|$)')
+default_encoding = sys.version_info[0] < 3 and 'ascii' or 'utf-8'
+buffer_size = 1 << 20
+
+def detect_encoding(first_lines):
+    """Returns the encoding of a source whose first two lines (as bytes) are
+'first_lines': the one named by its coding cookie, 'utf-8' if it starts with a
+UTF-8 byte order mark, or otherwise the default for this version of Python."""
+    if first_lines and first_lines[0].startswith(codecs.BOM_UTF8):
+        return 'utf-8'
+    for line in first_lines[:2]:
+        line = line.decode('latin-1')
+        match = coding_cookie.match(line)
+        if match:
+            return codecs.lookup(match.group(1)).name
+        if not blank_or_comment.match(line):
+            break # The cookie only counts on the second line below a comment or blank line
+    return default_encoding
+
+class source_file:
+    """A source file opened for reading a line at a time, through a buffer of
+'buffer_size' bytes.  It has the readline(), read() and seek() of a file (and
+can be iterated over), and its 'encoding' and 'name'."""
+    def __init__(self, path, buffer_size=buffer_size):
+        self.name = path
+        self.fileh = io.open(path, 'rb', buffering=buffer_size)
+        self.encoding = detect_encoding([self.fileh.readline(), self.fileh.readline()])
+        self.fileh.seek(0)
+        self.decode = not isinstance('', bytes)
+
+    def readline(self):
+        line = self.fileh.readline()
+        if self.decode:
+            return line.decode(self.encoding)
+        return line
+
+    def read(self):
+        """Returns the rest of the file whole, for the stages that need all of it at once."""
+        data = self.fileh.read()
+        if self.decode:
+            return data.decode(self.encoding)
+        return data
+
+    def seek(self, offset):
+        self.fileh.seek(offset)
+
+    def close(self):
+        self.fileh.close()
+
+    def __iter__(self):
+        return iter(self.readline, self.decode and u'' or '')